@@ -1,30 +1,93 @@
 import streamlit as st
-import plotly.express as px
 import pandas as pd
+import numpy as np
 import os
-from parsers.movimientos_mp_parser import parse_transactions_from_mp
-from parsers.movimientos_santander_parser import parse_movimientos_santander
-from parsers.visa_resumen_parser import create_df_from_pdf
+import threading
 from datetime import datetime, timedelta
-from time import sleep
 import hashlib
 from streamlit_date_picker import date_range_picker, PickerType
-from spreadsheets import get_alias_names_map, get_tags_colors_map, get_tags_names_map, save_dataframe_to_spreadsheet, spreadsheet_to_pandas, CREDENTIALS_FILE
+from spreadsheets import get_tags_colors_map, to_names_map, CREDENTIALS_FILE
+from storage import STORAGE, is_configured, mirror_status, read_table, read_tables, remove_rows, save_table, write_local_cache
+from sqlite_store import replace_database
+from ingestion import ingestion_report, parse_files, parser_kind
+from id_store import build_id_index, drop_ids, merge_by_id, normalize_ids
+from movimientos import MOVIMIENTOS, parse_movimientos, sort_by_date
+from parsers.schema import memory_reports
+from categorizer import invalidate_names, match_names_memoized, tags_map_key
+from rollup import build_rollup, month_range, query_rollup, update_rollup
+from search_index import new_index, search, update_index
+from profiling import ENABLED as PROFILING, profile_run, sheets_counters, stage
 
-MOVIMIENTOS = 'movimientos'
-DB_NAME = "movimientos.db"
 VALID_EXTENSIONS = (".xlsx", ".xls", ".pdf", ".db", ".json")
-
-
-def load_db():
-    df = spreadsheet_to_pandas(MOVIMIENTOS)
-    if 'alias' not in df.columns:
-        df['alias'] = ""
-
-    df['date'] = pd.to_datetime(df['date'])
-    df['monto'] = df['monto'].astype(float)
-    df['alias'] = df['alias'].fillna('')
-    st.session_state['movimientos'] = order_df(df)
+TABLE_PAGE_SIZES = [50, 100, 250, 500]
+HIDDEN_COLUMNS = ['color', 'id', 'label', 'raw']
+SHARED_CACHE_TTL = 300
+NAMES_MAPS = {'tags': 'tags_names_map', 'alias': 'alias_names_map'}
+SEARCH_RESULTS_LIMIT = 100
+ROLLUP_HASH_COLUMNS = ['id', 'date', 'monto', 'nombre']
+NAMES_COLUMNS = ['categoria', 'alias']
+
+_shared_load = threading.local()
+
+
+def set_movimientos(df):
+    '''df is the shared cached frame, the session works on a shallow copy of it'''
+    st.session_state['movimientos_source'] = df
+    movimientos = sort_by_date(df.copy(deep=False))
+    # el indice de ids guarda etiquetas de filas, la copia de la sesion tiene las suyas
+    movimientos.index = pd.RangeIndex(len(movimientos))
+    st.session_state['movimientos'] = movimientos
+    st.session_state['movimientos_ids'] = build_id_index(movimientos)
+    # add_tags reemplaza estas columnas en cada rerun, se guardan las que vinieron de la tabla
+    st.session_state['stored_labels'] = {col: movimientos[col] for col in NAMES_COLUMNS if col in movimientos.columns}
+
+
+def load_db(force=False):
+    set_movimientos(read_table(MOVIMIENTOS, parse=parse_movimientos, force=force))
+
+
+@st.cache_resource
+def shared_cache_stats():
+    '''hits and misses of the shared sheets, counted for every session of the server'''
+    return {'hits': 0, 'misses': 0, 'lock': threading.Lock()}
+
+
+@st.cache_resource(ttl=SHARED_CACHE_TTL, show_spinner=False)
+def load_shared_sheets(_force=False):
+    '''movimientos, tags and alias in one request (movimientos only when the local copy is stale).
+    The result is shared by every session, concurrent sessions wait for a single fetch'''
+    _shared_load.missed = True
+    return read_tables([MOVIMIENTOS, 'tags', 'alias'], cached=[MOVIMIENTOS], force=_force,
+                       parsers={MOVIMIENTOS: parse_movimientos, 'tags': to_names_map, 'alias': to_names_map})
+
+
+def invalidate_shared_sheets():
+    '''called after every write, so the next run of any session reads the new data'''
+    load_shared_sheets.clear()
+
+
+def get_shared_sheets(force=False):
+    if force:
+        invalidate_shared_sheets()
+    _shared_load.missed = False
+    sheets = load_shared_sheets(_force=force)
+    stats = shared_cache_stats()
+    with stats['lock']:
+        stats['misses' if _shared_load.missed else 'hits'] += 1
+    return sheets
+
+
+def load_all(force=False):
+    sheets = get_shared_sheets(force)
+    if sheets[MOVIMIENTOS] is not st.session_state.get('movimientos_source'):
+        set_movimientos(sheets[MOVIMIENTOS])
+    # los forms modifican los mapas, cada sesion trabaja sobre su copia (o la que tiene cambios pendientes)
+    staged_maps = get_pending_changes()['maps']
+    for sheet_name, state_key in NAMES_MAPS.items():
+        if sheet_name in staged_maps:
+            st.session_state[state_key] = staged_maps[sheet_name]
+        else:
+            st.session_state[state_key] = {tag: list(keywords) for tag, keywords in sheets[sheet_name].items()}
 
 
 def concat_by_id(df1, df2):
@@ -33,8 +96,7 @@ def concat_by_id(df1, df2):
         return df2
     if df2.empty:
         return df1
-    new_data = df2[~df2['id'].isin(df1['id'])]
-    return pd.concat([df1, new_data])
+    return merge_by_id(df1, [df2])
 
 
 def check_for_credentials(uploaded_files):
@@ -49,58 +111,122 @@ def check_for_credentials(uploaded_files):
 
 def parse_from_files(uploaded_files):
     df = st.session_state.movimientos
+    to_parse = []
     if uploaded_files:
         for uploaded_file in uploaded_files:
             file_name = uploaded_file.name
             os.makedirs("files", exist_ok=True)
             
+            if parser_kind(file_name):
+                to_parse.append((file_name, uploaded_file.getvalue()))
+                continue
+
+            if file_name.endswith(".db"):
+                # el uploader reenvia el archivo en cada rerun, se restaura una sola vez
+                digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+                if st.session_state.get('restored_db') != digest:
+                    replace_database(uploaded_file.getvalue())
+                    st.session_state.restored_db = digest
+                    invalidate_shared_sheets()
+                continue
+
             file_path = os.path.join('files', file_name)
             with open(file_path, "wb") as f:
                 f.write(uploaded_file.getbuffer())
-            
-            if file_name.endswith(".db"):
-                with open(file_path, "rb") as f:
-                    db_data = f.read()
-                with open(DB_NAME, "wb") as f:
-                    f.write(db_data)
-                
-            elif MOVIMIENTOS in file_name and file_name.endswith(".xlsx"):
-                df = concat_by_id(df, parse_movimientos_santander(file_path))
-            elif "Resumen de tarjeta de crédito" in file_name:
-                df = concat_by_id(df, create_df_from_pdf(file_path))
-            elif "download" in file_name or "mp-wallet" in file_name:
-                df = concat_by_id(df, parse_transactions_from_mp(file_path))
-    return df
+
+    results = parse_files(to_parse)
+    st.session_state['ingestion_report'] = ingestion_report(results)
+    return merge_by_id(df, [result['data'] for result in results], id_index=st.session_state.movimientos_ids)
 
 
 def load_data_from_files(uploaded_files):
-    load_db()
-    data = parse_from_files(uploaded_files)
-    data['id'] = data['id'].astype(str)
-    save_dataframe_to_spreadsheet(MOVIMIENTOS, data)
+    with stage('upload: load_db'):
+        load_db()
+    stored_count = len(st.session_state.movimientos_ids)
+    with stage('upload: parse_files'):
+        data = parse_from_files(uploaded_files)
+    if len(st.session_state.movimientos_ids) == stored_count:
+        return
+    data['id'] = normalize_ids(data['id'])
+    with stage('upload: save'):
+        save_table(MOVIMIENTOS, data)
+        write_local_cache(MOVIMIENTOS, parse_movimientos(data))
+    invalidate_shared_sheets()
+
+
+def style_page(page, colors):
+    '''Background color per row, built for the whole page at once instead of a callback per row'''
+    css = ('background-color: ' + colors.astype(object).fillna('').astype(str)).to_numpy()[:, None]
+    return page.style.apply(lambda df: pd.DataFrame(np.repeat(css, len(df.columns), axis=1), index=df.index, columns=df.columns), axis=None)
+
+
+def show_table(table, colors):
+    '''Sorts the whole table but only formats, styles and sends the visible page'''
+    columns = [col for col in table.columns if col not in HIDDEN_COLUMNS]
+    sort_col, order_col, size_col, page_col = st.columns(4)
+    sort_by = sort_col.selectbox("Ordenar por", columns, index=columns.index('date'), key='table_sort_by')
+    ascending = order_col.toggle("Ascendente", key='table_ascending')
+    page_size = size_col.selectbox("Filas por pagina", TABLE_PAGE_SIZES, key='table_page_size')
+    pages = max(1, -(-len(table) // page_size))
+    if st.session_state.get('table_page', 1) > pages:
+        st.session_state.table_page = pages
+    page_number = page_col.number_input(f"Pagina (de {pages})", min_value=1, max_value=pages, key='table_page')
+
+    start = (page_number - 1) * page_size
+    order = table[sort_by].reset_index(drop=True).sort_values(ascending=ascending, kind='stable').index
+    positions = order[start:start + page_size]
+    page = table.iloc[positions]
+    page = page.assign(date=page['date'].dt.date)
+    styled_page = style_page(page, colors.iloc[positions]).format({'monto': lambda x: f"${x:,.0f}"})
+    width = 200 + len(page.columns) * 150
+    st.dataframe(styled_page, hide_index=True, column_config={col: None for col in HIDDEN_COLUMNS}, width=width)
+    st.caption(f"{len(table)} movimientos")
+
+
+def get_categorization_memo(col_name):
+    memos = st.session_state.setdefault('categorization_memo', {})
+    return memos.setdefault(col_name, {})
+
 
+def add_tags(tags_map, col_name, default_tag='otros'):
+    '''Rows no keyword matches keep the label stored with them, not the one a previous rerun gave them'''
+    data = st.session_state.movimientos
+    tags = match_names_memoized(data['nombre'], tags_map, get_categorization_memo(col_name))
+    stored = st.session_state.get('stored_labels', {}).get(col_name)
+    if stored is not None:
+        tags = tags.fillna(stored.reindex(data.index))
+    data[col_name] = tags.fillna(default_tag).astype('category')
 
-def order_df(df):
-    first_columns = ['date', 'nombre', 'monto', 'cuotas', 'alias']
-    remaining_columns = [col for col in df.columns if col not in first_columns]
-    column_order = first_columns + remaining_columns
-    df = df.reindex(columns=column_order)
-    return df
 
+def refresh_rollup():
+    '''Keeps the monthly rollup of the categorized movimientos, adding only the rows it hasn't seen.
+    Rows are compared by a hash of their content, an edited or removed row rebuilds the rollup'''
+    data = st.session_state.movimientos
+    hashes = pd.util.hash_pandas_object(data[ROLLUP_HASH_COLUMNS], index=False).to_numpy()
+    key = (tags_map_key(st.session_state.tags_names_map), tags_map_key(st.session_state.alias_names_map))
+    rollup = st.session_state.get('rollup')
+    if rollup is not None and rollup['key'] == key and np.array_equal(rollup['hashes'], hashes):
+        return
 
-def color_rows(row):
-    return ['background-color: {}'.format(st.session_state.tags_colors_map[row['categoria']])] * len(row)
+    if rollup is None or rollup['key'] != key or not np.isin(rollup['hashes'], hashes).all():
+        rollup = {'key': key, 'hashes': hashes[:0], 'table': build_rollup(data.iloc[:0])}
+    is_new = ~np.isin(hashes, rollup['hashes'])
+    if len(rollup['hashes']) + is_new.sum() != len(data):
+        # filas repetidas: no se puede saber cuales son nuevas
+        rollup['table'], is_new = build_rollup(data.iloc[:0]), np.ones(len(data), dtype=bool)
+    rollup['table'] = update_rollup(rollup['table'], data[is_new])
+    rollup['hashes'] = hashes
+    st.session_state.rollup = rollup
 
 
-def add_tags(tags_map, col_name, default_tag='otros'):
-    data = st.session_state.movimientos
-    for tag, keywords in tags_map.items():
-        for keyword in keywords:
-            if tag == "ignore":
-                data.loc[data['nombre'].str.lower() == keyword.lower(), col_name] = tag
-            else:
-                data.loc[data['nombre'].str.contains(keyword, case=False), col_name] = tag
-    data[col_name] = data[col_name].fillna(default_tag)
+def get_pie_rows(data):
+    '''Rows for the pie charts and totals, from the rollup when the selected range covers whole months'''
+    bounds = picked_range()
+    months = month_range(*bounds) if bounds else None
+    if months and 'rollup' in st.session_state:
+        rows = query_rollup(st.session_state.rollup['table'], *months)
+        return rows[rows['categoria'] != 'ignore']
+    return data.assign(monto_abs=data['monto'].abs())
 
 
 def generate_id(row):
@@ -135,12 +261,44 @@ def create_custom_range_picker():
         st.session_state.end_datetime = date_range_string[1]
 
 
-def filter_data_by_date():
-    data = st.session_state.movimientos
-    if 'start_datetime' in st.session_state and 'end_datetime' in st.session_state:
-        start_date = st.session_state.start_datetime
-        end_date = st.session_state.end_datetime
-        st.session_state.movimientos = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
+def _picked_month(value):
+    '''the month picker gives 'YYYY-MM' (the date picker 'YYYY-MM-DD'), None for any other value'''
+    try:
+        return pd.Period(datetime.strptime(value, '%Y-%m'), 'M')
+    except (TypeError, ValueError):
+        return None
+
+
+def picked_range():
+    '''(start, end) of the picked range, both days included, None when nothing was picked.
+    A month from the month picker covers the whole month'''
+    if 'start_datetime' not in st.session_state or 'end_datetime' not in st.session_state:
+        return None
+    start_value, end_value = st.session_state.start_datetime, st.session_state.end_datetime
+    start_month, end_month = _picked_month(start_value), _picked_month(end_value)
+    start = start_month.start_time if start_month else pd.Timestamp(start_value)
+    end = end_month.end_time.normalize() if end_month else pd.Timestamp(end_value)
+    return start, end
+
+
+def filter_data_by_date(data):
+    '''data is sorted by date, so the range is a slice found by binary search'''
+    bounds = picked_range()
+    if bounds:
+        dates = data['date'].to_numpy()
+        start = dates.searchsorted(bounds[0].to_datetime64(), side='left')
+        end = dates.searchsorted(bounds[1].to_datetime64(), side='right')
+        return data.iloc[start:end]
+    return data
+
+
+def stage_keywords(sheet_name, col_name, tag_name, keywords):
+    '''Adds the keywords to a copy of the map, that is staged only if they are valid regex'''
+    names_map = {tag: list(tag_keywords) for tag, tag_keywords in st.session_state[NAMES_MAPS[sheet_name]].items()}
+    names_map.setdefault(tag_name, []).extend(keywords)
+    invalidate_names(get_categorization_memo(col_name), names_map, tag_name, keywords)
+    st.session_state[NAMES_MAPS[sheet_name]] = names_map
+    get_pending_changes()['maps'][sheet_name] = names_map
 
 
 def add_alias_form():
@@ -174,14 +332,10 @@ def add_alias_form():
             row = st.session_state.row_to_insert_alias
             tag_name = row['alias_name'][0].strip()
             keywords = row['keyword'].item().strip().split(',')
-            if tag_name not in st.session_state.alias_names_map:
-                st.session_state.alias_names_map[tag_name] = []
-            st.session_state.alias_names_map[tag_name].extend(keywords)
-            alias_name_map = [{'id': i, 'tag_name': k, 'keywords': ','.join(set(v))} for i, (k, v) in enumerate(st.session_state.alias_names_map.items())]
             try:
-                save_dataframe_to_spreadsheet(sheet_name='alias', dataframe=pd.DataFrame(alias_name_map))
-                st.success(f"Etiqueta '{tag_name}' agregada con éxito.")
-                del st.session_state['inserting_row']
+                stage_keywords('alias', 'alias', tag_name, keywords)
+                st.success(f"Etiqueta '{tag_name}' agregada, pendiente de aplicar.")
+                st.session_state.pop('inserting_row_alias', None)
             except Exception as e:
                 st.error(f"Error al guardar la etiqueta: {e}")
 
@@ -217,44 +371,66 @@ def add_tags_form():
             row = st.session_state.row_to_insert
             tag_name = row['tag_name'][0].strip()
             keywords = row['keywords'].item().strip().split(',')
-            if tag_name not in st.session_state.tags_names_map:
-                st.session_state.tags_names_map[tag_name] = []
-            st.session_state.tags_names_map[tag_name].extend(keywords)
-            tags_name_map = [{'id': i, 'tag_name': k, 'keywords': ','.join(set(v))} for i, (k, v) in enumerate(st.session_state.tags_names_map.items())]
             try:
-                save_dataframe_to_spreadsheet(sheet_name='tags', dataframe=pd.DataFrame(tags_name_map))
-                st.success(f"Etiqueta '{tag_name}' agregada con éxito.")
-                del st.session_state['inserting_row']
+                stage_keywords('tags', 'categoria', tag_name, keywords)
+                st.success(f"Etiqueta '{tag_name}' agregada, pendiente de aplicar.")
+                st.session_state.pop('inserting_row', None)
             except Exception as e:
                 st.error(f"Error al guardar la etiqueta: {e}")
 
 
+def get_search_index():
+    '''Index over id, nombre and alias of the session movimientos, a row is identified by its id and
+    how many rows before it share that id. It is updated when movimientos or the alias map change,
+    only the new rows and the ones whose texts changed are indexed again'''
+    data = st.session_state.movimientos
+    key = tags_map_key(st.session_state.alias_names_map)
+    state = st.session_state.setdefault('search_index', {'key': None, 'source': None, 'index': new_index()})
+    if state['source'] is not data or state['key'] != key:
+        ids = normalize_ids(data['id'])
+        doc_ids = list(zip(ids, ids.groupby(ids, sort=False).cumcount()))
+        update_index(state['index'], doc_ids, ids, data['nombre'], data['alias'])
+        state['source'], state['key'] = data, key
+    return state['index']
+
+
+def visible_results(result_df, table):
+    '''the pending deletes are hidden, not removed, so discarding the changes shows them again'''
+    if result_df.empty:
+        return result_df
+    if table == MOVIMIENTOS:
+        return result_df[~result_df['id'].astype(str).isin(get_pending_changes()['deletes'])]
+    return result_df[result_df['tag_name'].isin(st.session_state[NAMES_MAPS[table]])]
+
+
 def search_expense_panel():
     st.subheader("Buscar Gasto")
 
-    search_option = st.selectbox("Buscar por", ["ID", "Nombre", "tags", "alias"])
-    table_map = {
-        "ID": MOVIMIENTOS,
-        "Nombre": MOVIMIENTOS,
-        "tags": "tags",
-        "alias": "alias"
-    }
+    search_option = st.selectbox("Buscar por", ["Nombre", "ID", "tags", "alias"])
     search_query = st.text_input("Ingrese el valor de búsqueda")
+    fuzzy = st.checkbox("Busqueda aproximada", value=True)
 
     if st.button("Buscar"):
-        result_df = spreadsheet_to_pandas(table_map[search_option])
-        if search_option == "ID":
-            result_df = result_df[result_df['id'] == search_query]
-        elif search_option == "Nombre":
-            result_df = result_df[result_df['nombre'].str.contains(search_query, case=False)]
-        elif search_option == "tags" or search_option == "alias":
-            result_df = result_df[result_df['tag_name'] == search_query]
-        
-        st.session_state['search_results'] = result_df.to_dict('records'), table_map[search_option]
+        if search_option in NAMES_MAPS:
+            table = search_option
+            result_df = names_map_to_df(st.session_state[NAMES_MAPS[search_option]])
+            result_df = result_df[result_df['tag_name'] == search_query.strip()]
+        else:
+            table = MOVIMIENTOS
+            data = st.session_state.movimientos
+            if search_option == "ID":
+                result_df = data[normalize_ids(data['id']) == search_query.strip()]
+            else:
+                result_df = data.iloc[sorted(search(get_search_index(), search_query, fuzzy=fuzzy))]
+            if len(result_df) > SEARCH_RESULTS_LIMIT:
+                st.write(f"{len(result_df)} resultados, se muestran los ultimos {SEARCH_RESULTS_LIMIT}.")
+                result_df = result_df.tail(SEARCH_RESULTS_LIMIT)
+
+        st.session_state['search_results'] = result_df.to_dict('records'), table
 
     if 'search_results' in st.session_state:
         result_df_saved, table = st.session_state['search_results']
-        result_df = pd.DataFrame(result_df_saved)
+        result_df = visible_results(pd.DataFrame(result_df_saved), table)
         if not result_df.empty:
             st.write("Resultados de la búsqueda:")
             for index, row in result_df.iterrows():
@@ -263,24 +439,72 @@ def search_expense_panel():
                     st.write(row.to_frame().T)
                 with col2:
                     if st.button("Eliminar", key=f"delete_{row['id']}"):
-                        delete_expense(row['id'], table, result_df)
-                        with col1:
-                            st.success(f"Gasto con ID {row['id']} eliminado.")
-                        st.session_state['search_results'] = result_df[result_df['id'] != row['id']].to_dict('records'), table
-                        sleep(2)
+                        delete_expense(row, table)
+                        st.toast(f"{row['id']} marcado para eliminar, pendiente de aplicar.")
                         st.rerun()
         else:
             st.write("No se encontraron resultados.")
 
 
-def delete_expense(expense_id, table, df):
-    df = df[df['id'] != expense_id]
-    save_dataframe_to_spreadsheet(table, df)
+def get_pending_changes():
+    '''deletes and tag/alias edits of this session, written together by commit_pending_changes'''
+    return st.session_state.setdefault('pending_changes', {'deletes': set(), 'maps': {}})
+
+
+def names_map_to_df(names_map):
+    return pd.DataFrame([{'id': i, 'tag_name': k, 'keywords': ','.join(dict.fromkeys(v))} for i, (k, v) in enumerate(names_map.items())],
+                        columns=['id', 'tag_name', 'keywords'])
+
+
+def delete_expense(row, table):
+    '''stages the delete, movimientos by id and tags/alias by tag_name'''
+    pending = get_pending_changes()
+    if table == MOVIMIENTOS:
+        pending['deletes'].add(str(row['id']))
+    else:
+        names_map = st.session_state[NAMES_MAPS[table]]
+        names_map.pop(row['tag_name'], None)
+        pending['maps'][table] = names_map
+
+
+def commit_pending_changes():
+    '''one write per table: in Sheets a row level sync, the deleted rows go in a single deleteDimension batch'''
+    pending = get_pending_changes()
+    if pending['deletes']:
+        load_db()
+        df = drop_ids(st.session_state.movimientos, st.session_state.movimientos_ids, pending['deletes'])
+        remove_rows(MOVIMIENTOS, pending['deletes'], df)
+        write_local_cache(MOVIMIENTOS, df)
+    for sheet_name, names_map in pending['maps'].items():
+        save_table(sheet_name, names_map_to_df(names_map), key='tag_name')
+    invalidate_shared_sheets()
+    del st.session_state['pending_changes']
+    st.session_state.pop('search_results', None)
+
+
+def pending_changes_panel():
+    pending = get_pending_changes()
+    if not pending['deletes'] and not pending['maps']:
+        return
+    st.write(f"Cambios pendientes: {len(pending['deletes'])} movimientos a eliminar, "
+             f"tablas editadas: {', '.join(pending['maps']) or 'ninguna'}")
+    apply_col, discard_col = st.columns(2)
+    if apply_col.button("Aplicar cambios"):
+        try:
+            commit_pending_changes()
+            st.toast("Cambios aplicados.")
+            st.rerun()
+        except Exception as e:
+            st.error(f"Error al aplicar los cambios: {e}")
+    if discard_col.button("Descartar cambios"):
+        del st.session_state['pending_changes']
+        st.rerun()
 
 
 def create_category_buttons():
     categories = ["todos"] + list(st.session_state.tags_names_map.keys())
-    categories.remove("ignore")
+    if "ignore" in categories:
+        categories.remove("ignore")
     categories.append("otros")
     cols = st.columns(len(categories))
 
@@ -289,22 +513,33 @@ def create_category_buttons():
             st.session_state.selected_category = category
 
 
-def filter_ignore_tags():
-    data = st.session_state.movimientos
-    st.session_state.movimientos = data[data['categoria'] != 'ignore']
+def filter_ignore_tags(data):
+    return data[data['categoria'] != 'ignore']
 
 
 def pfinance_app():
     create_custom_range_picker()
     create_month_range_picker()
+    refresh = st.button("Actualizar datos")
+    if MOVIMIENTOS in memory_reports:
+        before, after = memory_reports[MOVIMIENTOS]
+        st.sidebar.caption(f"movimientos en memoria: {after / 1e6:.1f} MB (sin tipos compactos: {before / 1e6:.1f} MB)")
+    stats = shared_cache_stats()
+    st.sidebar.caption(f"cache compartido: {stats['hits']} hits, {stats['misses']} misses")
+    pending_mirror, mirror_errors = mirror_status()
+    st.sidebar.caption(f"almacenamiento: {STORAGE}" + (f", sincronizando con Sheets: {', '.join(pending_mirror)}" if pending_mirror else ""))
+    for table_name, error in mirror_errors.items():
+        st.sidebar.warning(f"No se pudo copiar {table_name} a Sheets: {error}")
     if uploaded_files := st.file_uploader("Subir archivos", type=VALID_EXTENSIONS, accept_multiple_files=True):
         check_for_credentials(uploaded_files)
         load_data_from_files(uploaded_files)
+        if not st.session_state.ingestion_report.empty:
+            st.dataframe(st.session_state.ingestion_report, hide_index=True)
 
-    if os.path.exists(CREDENTIALS_FILE):
-        st.session_state.tags_names_map = get_tags_names_map()
-        st.session_state.alias_names_map = get_alias_names_map()
-        st.session_state.tags_colors_map = get_tags_colors_map(st.session_state.tags_names_map)
+    if is_configured():
+        with stage('load_all'):
+            load_all(force=refresh)
+            st.session_state.tags_colors_map = get_tags_colors_map(st.session_state.tags_names_map)
     else:
         st.error("Por favor, suba el archivo de credenciales de Google Sheets.")
         return
@@ -315,53 +550,80 @@ def pfinance_app():
         st.session_state.selected_category = "todos"
         return
 
-    load_db()
-    add_tags(tags_map=st.session_state.tags_names_map, col_name='categoria')
-    add_tags(tags_map=st.session_state.alias_names_map, col_name='alias', default_tag="")
-    filter_data_by_date()
-    filter_ignore_tags()
+    with stage('add_tags'):
+        add_tags(tags_map=st.session_state.tags_names_map, col_name='categoria')
+        add_tags(tags_map=st.session_state.alias_names_map, col_name='alias', default_tag="")
+    with stage('rollup'):
+        refresh_rollup()
+    with stage('filter_data_by_date'):
+        data = filter_ignore_tags(filter_data_by_date(st.session_state.movimientos))
     create_category_buttons()
-    
-    data = st.session_state.movimientos
+    # plotly.express tarda en importarse y la primera corrida termina antes de los graficos
+    import plotly.express as px
+
     st.write(f'### Distribucion de gastos entre: {st.session_state.start_datetime} y {st.session_state.end_datetime}')
+    with stage('groupby'):
+        pie_rows = get_pie_rows(data)
     if st.session_state.selected_category == "todos":
-        grouped_data = data.groupby('categoria')['monto'].sum().reset_index()
-        grouped_data['color'] = grouped_data['categoria'].map(st.session_state.tags_colors_map)
+        with stage('groupby'):
+            grouped_data = pie_rows.groupby('categoria', observed=True)['monto'].sum().reset_index()
+            grouped_data['color'] = grouped_data['categoria'].map(st.session_state.tags_colors_map)
         filtered_data = grouped_data
         filter_column = 'categoria'
         total_amount = filtered_data['monto'].sum()
         filtered_data_all_positive = filtered_data.copy()
         filtered_data_all_positive['monto'] = filtered_data_all_positive['monto'].abs()
-        fig = px.pie(filtered_data_all_positive, names=filter_column, values='monto', color='categoria', color_discrete_map=st.session_state.tags_colors_map, hole=0.4)
-        fig.add_annotation(text=f"${total_amount:,.0f}", x=0.5, y=0.5, font_size=20, showarrow=False)
-        selected_point = st.plotly_chart(fig, use_container_width=True)
-        styled_df = data.style.apply(color_rows, axis=1)
+        with stage('plotly'):
+            fig = px.pie(filtered_data_all_positive, names=filter_column, values='monto', color='categoria', color_discrete_map=st.session_state.tags_colors_map, hole=0.4)
+            fig.add_annotation(text=f"${total_amount:,.0f}", x=0.5, y=0.5, font_size=20, showarrow=False)
+            selected_point = st.plotly_chart(fig, use_container_width=True)
+        table, colors = data, data['categoria'].map(st.session_state.tags_colors_map)
 
     else:
-        filtered_data = data[data['categoria'] == st.session_state.selected_category]
-        unique_names = filtered_data['nombre'].unique()
+        with stage('groupby'):
+            filtered_data = data[data['categoria'] == st.session_state.selected_category]
+            category_rows = pie_rows[pie_rows['categoria'] == st.session_state.selected_category]
+        unique_names = category_rows['nombre'].unique()
         unique_colors = px.colors.qualitative.Plotly
         name_color_map = {name: unique_colors[i % len(unique_colors)] for i, name in enumerate(unique_names)}
-        filtered_data['label'] = filtered_data.apply(lambda row: row['alias'] if row['alias'] else row['nombre'], axis=1)
+        filtered_data['label'] = filtered_data['alias'].astype(object).where(filtered_data['alias'].astype(bool), filtered_data['nombre'])
         filter_column = 'label'
         filtered_data['color'] = filtered_data['nombre'].map(name_color_map)
-        total_amount = filtered_data['monto'].sum()
-        filtered_data_all_positive = filtered_data.copy()
-        filtered_data_all_positive['monto'] = filtered_data_all_positive['monto'].abs()
-        fig = px.pie(filtered_data_all_positive, names=filter_column, values='monto', color='nombre', color_discrete_map=name_color_map, hole=0.4)
-        fig.add_annotation(text=f"${total_amount:,.0f}", x=0.5, y=0.5, font_size=20, showarrow=False)
-        selected_point = st.plotly_chart(fig, use_container_width=True)
-        styled_df = filtered_data.style.apply(lambda row: ['background-color: {}'.format(row['color'])] * len(row), axis=1)
-
-    styled_df = styled_df.format({'monto': lambda x: f"${x:,.0f}"})
-    styled_df.data['date'] = pd.to_datetime(styled_df.data['date']).dt.date
-    width = 200 + len(styled_df.data.columns) * 150
-    st.dataframe(styled_df, hide_index=True, column_config={"color": None, "id": None, "label": None, 'raw': None}, width=width)
-
-    add_tags_form()
-    add_alias_form()
-    search_expense_panel()
+        total_amount = category_rows['monto'].sum()
+        filtered_data_all_positive = category_rows.assign(label=category_rows['alias'].astype(object).where(category_rows['alias'].astype(bool), category_rows['nombre']),
+                                                          monto=category_rows['monto_abs'])
+        with stage('plotly'):
+            fig = px.pie(filtered_data_all_positive, names=filter_column, values='monto', color='nombre', color_discrete_map=name_color_map, hole=0.4)
+            fig.add_annotation(text=f"${total_amount:,.0f}", x=0.5, y=0.5, font_size=20, showarrow=False)
+            selected_point = st.plotly_chart(fig, use_container_width=True)
+        table, colors = filtered_data, filtered_data['color']
+
+    with stage('table'):
+        show_table(table, colors)
+
+    with stage('forms'):
+        add_tags_form()
+        add_alias_form()
+        search_expense_panel()
+        pending_changes_panel()
+
+
+def show_debug_sidebar(stages, sheets_before):
+    '''timings of this rerun and the Sheets traffic it caused, only with PFINANCE_PROFILE'''
+    timings = pd.DataFrame(stages, columns=['etapa', 'segundos']).groupby('etapa', sort=False)['segundos'].sum().reset_index()
+    sheets_now = sheets_counters()
+    with st.sidebar.expander("Debug: tiempos del rerun", expanded=True):
+        st.dataframe(timings, hide_index=True)
+        st.caption(f"total {timings['segundos'].sum():.3f}s")
+        st.caption(f"Sheets: {sheets_now['calls'] - sheets_before['calls']} llamadas, "
+                   f"{(sheets_now['bytes_sent'] - sheets_before['bytes_sent']) / 1e3:.1f} kB enviados, "
+                   f"{(sheets_now['bytes_received'] - sheets_before['bytes_received']) / 1e3:.1f} kB recibidos "
+                   f"({sheets_now['calls']} llamadas desde que arranco el servidor)")
 
 
 if __name__ == "__main__":
-    pfinance_app()
+    with profile_run() as stages:
+        sheets_before = sheets_counters()
+        pfinance_app()
+        if PROFILING:
+            show_debug_sidebar(stages, sheets_before)
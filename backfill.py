@@ -0,0 +1,161 @@
+'''Ingests every statement under a directory without the Streamlit app, for backfilling years of files.
+
+    python backfill.py ~/resumenes                 # parse, merge by id with the stored movimientos, one write
+    python backfill.py ~/resumenes --dry-run       # same report, nothing is written
+    python backfill.py ~/resumenes --restart       # forget the progress of previous runs
+
+Files are picked with the same name rules as the uploader (ingestion.parser_kind).
+Progress is kept in a state file: files already written are skipped on the next run, and
+files parsed by an interrupted run come from the parse cache, so a backfill can be resumed.
+A file that can't be parsed is recorded as failed and the rest go on, the exit status is then 1
+and the next run tries it again.
+Uses the configured storage (PFINANCE_STORAGE), with sqlite the Sheets mirror is waited for'''
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+from id_store import build_id_index, merge_by_id, normalize_ids
+from ingestion import FILES_DIR, INGEST_WORKERS, parse_files, parser_kind
+from movimientos import MOVIMIENTOS, parse_movimientos
+from storage import STORAGE, is_configured, read_table, save_table, wait_for_mirror, write_local_cache
+
+
+STATE_FILE = os.path.join(FILES_DIR, 'backfill-state.json')
+
+
+def find_statements(directory):
+    '''paths with a parser, sorted so that every run walks them in the same order'''
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths += [os.path.join(root, file_name) for file_name in sorted(files) if parser_kind(file_name)]
+    return paths
+
+
+def load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_path, state):
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+
+def parse_statements(paths, state, state_path, workers, dry_run):
+    '''results of every file, failed ones with their 'error'. The state is saved after each batch'''
+    results, batch_size = [], max(1, workers) * 2
+    for batch in [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]:
+        files = []
+        for path in batch:
+            with open(path, 'rb') as f:
+                files.append((os.path.basename(path), f.read()))
+        for path, (_, file_bytes), result in zip(batch, files, parse_files(files, workers=workers, keep_going=True)):
+            result['path'] = path
+            results.append(result)
+            if 'error' in result:
+                print(f"{'FAILED':>12} {'':>8}  {path}: {result['error']}", flush=True)
+                entry = {'error': result['error']}
+            else:
+                print(f"{result['rows']:>7} rows {result['seconds']:>7.2f}s  {path}", flush=True)
+                entry = {'rows': result['rows']}
+            if not dry_run:
+                state[path] = {'digest': hashlib.sha256(file_bytes).hexdigest(), 'written': False, **entry}
+        if not dry_run:
+            save_state(state_path, state)
+    return results
+
+
+def pending_statements(paths, state):
+    '''files not written yet, or whose content changed since they were'''
+    pending = []
+    for path in paths:
+        entry = state.get(path)
+        if entry and entry['written']:
+            with open(path, 'rb') as f:
+                if hashlib.sha256(f.read()).hexdigest() == entry['digest']:
+                    continue
+        pending.append(path)
+    return pending
+
+
+def merge_statements(existing, results):
+    '''every parsed file merged by id into the stored movimientos, and the number of new rows'''
+    id_index = build_id_index(existing)
+    stored_count = len(id_index)
+    data = merge_by_id(existing, [result['data'] for result in results], id_index=id_index)
+    new_rows = len(id_index) - stored_count
+    return data, new_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory')
+    parser.add_argument('--dry-run', action='store_true', help="parse and merge, but write nothing")
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS)
+    parser.add_argument('--state', default=STATE_FILE, help="progress file")
+    parser.add_argument('--restart', action='store_true', help="ignore the progress of previous runs")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    if not is_configured():
+        parser.error("no storage configured: upload the credentials in the app or use PFINANCE_STORAGE=sqlite")
+
+    start = time.perf_counter()
+    paths = [os.path.abspath(path) for path in find_statements(args.directory)]
+    state = {} if args.restart else load_state(args.state)
+    pending = pending_statements(paths, state)
+    print(f"{len(paths)} statements found, {len(paths) - len(pending)} already written, {len(pending)} to parse", flush=True)
+    if not pending:
+        return 0
+
+    parse_start = time.perf_counter()
+    results = parse_statements(pending, state, args.state, args.workers, args.dry_run)
+    parse_seconds = time.perf_counter() - parse_start
+    failed = [result for result in results if 'error' in result]
+    results = [result for result in results if 'error' not in result]
+    parsed_rows = sum(result['rows'] for result in results)
+
+    existing = read_table(MOVIMIENTOS, parse=parse_movimientos)
+    data, new_rows = merge_statements(existing, results)
+    write_seconds = 0.0
+    if new_rows and not args.dry_run:
+        write_start = time.perf_counter()
+        data['id'] = normalize_ids(data['id'])
+        save_table(MOVIMIENTOS, data)
+        write_local_cache(MOVIMIENTOS, parse_movimientos(data))
+        write_seconds = time.perf_counter() - write_start
+    if not args.dry_run:
+        for result in results:
+            state[result['path']]['written'] = True
+        save_state(args.state, state)
+
+    print(f"\n{len(results)} files, {parsed_rows} rows parsed in {parse_seconds:.2f}s "
+          f"({len(results) / parse_seconds:.1f} files/s, {parsed_rows / parse_seconds:.0f} rows/s)")
+    print(f"{new_rows} new movimientos, {len(existing)} already stored")
+    if args.dry_run:
+        print("dry run: nothing was written")
+    else:
+        print(f"written to {STORAGE} in {write_seconds:.2f}s" if new_rows else "nothing new to write")
+        wait_for_mirror()
+    print(f"total {time.perf_counter() - start:.2f}s")
+    if failed:
+        print(f"\n{len(failed)} files failed, they are tried again on the next run:")
+        for result in failed:
+            print(f"    {result['path']}: {result['error']}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+'''Synthetic inputs with the layout the parsers expect: Santander .xlsx, Visa and MercadoPago PDFs,
+movimientos frames and tag maps. Everything comes from a seeded random.Random, same size same input'''
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+from openpyxl import Workbook
+
+
+MERCHANTS = ["COTO", "CARREFOUR", "DIA", "JUMBO", "DISCO", "FARMACITY", "YPF", "SHELL", "AXION", "MERCADOLIBRE",
+             "RAPPI", "PEDIDOSYA", "UBER", "CABIFY", "NETFLIX", "SPOTIFY", "STEAM", "EDENOR", "METROGAS", "AYSA",
+             "PERSONAL", "MOVISTAR", "CLARO", "FRAVEGA", "GARBARINO", "MOSTAZA", "MCDONALDS", "STARBUCKS", "HAVANNA",
+             "GRIDO", "EASY", "SODIMAC", "DECATHLON", "ZARA", "FALABELLA", "OPENAI USD", "GOOGLE USD", "AMAZON USD"]
+WORDS = ["SUCURSAL", "CENTRO", "NORTE", "SUR", "EXPRESS", "MARKET", "PALERMO", "BELGRANO", "CABALLITO", "ONLINE",
+         "SA", "SRL", "STORE", "SHOP", "PAGO", "SERVICIOS"]
+PEOPLE = ["Juan Perez", "Maria Gomez", "Lucia Fernandez", "Carlos Rodriguez", "Ana Martinez", "Diego Lopez",
+          "Sofia Garcia", "Martin Sanchez", "Valentina Romero", "Pablo Diaz"]
+VISA_MONTHS = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septie.", "Octubre", "Noviem.", "Diciem."]
+SANTANDER_EXCLUDED = ["Impuesto de sellos", "Acreditacion de haberes", "Pago tarjeta de credito visa", "Transferencia a terceros"]
+
+LINES_PER_PAGE = 60
+
+
+def merchant_name(rng):
+    return f"{rng.choice(MERCHANTS)} {rng.choice(WORDS)} {rng.randint(1, 999)}"
+
+
+def random_dates(rng, n, start=date(2023, 1, 1), days=730):
+    return sorted(start + timedelta(days=rng.randrange(days)) for _ in range(n))
+
+
+def format_ars(amount):
+    '''1234.5 -> 1.234,50 as in the statements'''
+    return f"{amount:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+def santander_xlsx(path, n, rng):
+    '''Account statement with a few header rows before the table, excluded rows mixed in'''
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Movimientos")
+    ws.append(["Banco Santander"])
+    ws.append(["Cuenta", "CA $ 000-123456/7"])
+    ws.append([])
+    ws.append([None, "Fecha", "Sucursal origen", "Descripción", "Referencia", "Caja de Ahorro", "Cuenta Corriente", "Saldo"])
+    balance = 1_000_000.0
+    for i, day in enumerate(random_dates(rng, n)):
+        if rng.random() < 0.05:
+            description = rng.choice(SANTANDER_EXCLUDED)
+        else:
+            description = f"Compra con tarjeta de debito {merchant_name(rng)}"
+        amount = round(rng.uniform(-80_000, -100), 2)
+        balance += amount
+        ws.append([None, day, f"{rng.randint(1, 500):03d}", description, 10_000_000 + i, amount, None, round(balance, 2)])
+    wb.save(path)
+
+
+def visa_lines(n, rng):
+    '''Consumos ordered by date, the first one of each month and of each page carries "YY Mes".
+    The parser reads every page bottom up, so a page can't inherit the month of the previous one'''
+    lines, last_month = ["RESUMEN DE CUENTA VISA", "FECHA COMPROBANTE DETALLE DE TRANSACCION PESOS"], None
+    for i, day in enumerate(random_dates(rng, n)):
+        prefix = ""
+        if (day.year, day.month) != last_month or len(lines) % LINES_PER_PAGE == 0:
+            prefix = f"{day.year % 100:02d} {VISA_MONTHS[day.month - 1]} "
+            last_month = (day.year, day.month)
+        cuotas = f" C.{rng.randint(1, 3):02d}/03" if rng.random() < 0.15 else ""
+        amount = rng.uniform(10, 5_000) if "USD" in (name := merchant_name(rng)) else rng.uniform(500, 150_000)
+        lines.append(f"{prefix}{day.day:02d} {100000 + i % 900000:06d} * {name}{cuotas} {format_ars(amount)}")
+    lines.append("SALDO ACTUAL")
+    return lines
+
+
+def mp_lines(n, rng):
+    '''Transfers in two lines (concept, then date/id/amounts) plus payments the parser skips'''
+    lines, balance = ["RESUMEN DE CUENTA MERCADO PAGO", "DETALLE DE MOVIMIENTOS"], 500_000.0
+    for i, day in enumerate(random_dates(rng, n)):
+        amount = round(rng.uniform(100, 60_000), 2)
+        if rng.random() < 0.1:
+            concept = f"Pago {rng.choice(MERCHANTS)}"
+        else:
+            concept = f"Transferencia {rng.choice(['enviada', 'recibida'])} {rng.choice(PEOPLE)}"
+        balance -= amount
+        lines.append(concept)
+        lines.append(f"{day.strftime('%d-%m-%Y')} {80_000_000_000 + i} $ -{format_ars(amount)} $ {format_ars(balance)}")
+    return lines
+
+
+def _pdf_string(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path, lines, lines_per_page=LINES_PER_PAGE):
+    '''Minimal PDF 1.4 writer: Helvetica text, one line per row, enough for pdfplumber'''
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = {1: "<< /Type /Catalog /Pages 2 0 R >>",
+               3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"}
+    page_ids = []
+    for number, page in enumerate(pages):
+        content_id, page_id = 4 + 2 * number, 5 + 2 * number
+        content = "BT /F1 9 Tf 12 TL 30 810 Td " + " ".join(f"({_pdf_string(line)}) '" for line in page) + " ET"
+        objects[content_id] = f"<< /Length {len(content.encode('latin-1'))} >>\nstream\n{content}\nendstream"
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_id} 0 R "
+                            "/Resources << /Font << /F1 3 0 R >> >> >>")
+        page_ids.append(page_id)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += f"{object_id} 0 obj\n{objects[object_id]}\nendobj\n".encode('latin-1')
+    xref = len(out)
+    size = max(objects) + 1
+    out += f"xref\n0 {size}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offsets[i]:010d} 00000 n \n" for i in range(1, size)).encode()
+    out += f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def visa_pdf(path, n, rng):
+    write_pdf(path, visa_lines(n, rng))
+
+
+def mp_pdf(path, n, rng):
+    write_pdf(path, mp_lines(n, rng))
+
+
+def tags_map(n_keywords, rng):
+    '''{tag: [keywords]}, about 20 keywords per tag, with some regex keywords and the ignore tag'''
+    keywords = [merchant.lower() for merchant in MERCHANTS]
+    keywords += [f"{rng.choice(WORDS).lower()} {rng.randint(1, 999)}" for _ in range(max(0, n_keywords - len(keywords)))]
+    keywords = keywords[:n_keywords]
+    keywords[::25] = [f"{keyword.split()[0]}.*{rng.randint(1, 9)}" for keyword in keywords[::25]]
+    tags_count = max(2, n_keywords // 20)
+    result = {f"tag_{i}": [] for i in range(tags_count)}
+    for i, keyword in enumerate(keywords):
+        result[f"tag_{i % tags_count}"].append(keyword)
+    result['ignore'] = [f"{rng.choice(SANTANDER_EXCLUDED)}"]
+    return result
+
+
+def movimientos_frame(n, rng, first_id=0):
+    '''raw movimientos as they come from the sheet, before parse_movimientos'''
+    return pd.DataFrame({
+        'date': [day.isoformat() for day in random_dates(rng, n)],
+        'nombre': [merchant_name(rng) for _ in range(n)],
+        'monto': [round(rng.uniform(-5_000, 150_000), 2) for _ in range(n)],
+        'cuotas': [''] * n,
+        'alias': [''] * n,
+        'categoria': [''] * n,
+        'origen': [rng.choice(['visa', 'MercadoPago', 'movimientos-santander']) for _ in range(n)],
+        'id': [str(first_id + i) for i in range(n)],
+    })
+
+
+def rng_for(*key):
+    return random.Random('-'.join(map(str, key)))
@@ -0,0 +1,180 @@
+'''Times the parsers, the categorizer and the merge by id over synthetic inputs and compares with a baseline.
+
+    python -m benchmarks.run                              # default sizes, compares with benchmarks/baseline.json
+    python -m benchmarks.run --sizes 1000 100000 1000000 --keywords 10 10000 --stages santander add_tags
+    python -m benchmarks.run --save-baseline              # the current results become the baseline
+
+Runs offline: the spreadsheet client and the dolarapi request are replaced by stubs.
+Peak memory is measured with tracemalloc in a separate run, it covers the main process only'''
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import streamlit as st
+
+import app
+import local_cache
+import spreadsheets
+from parsers import usd_rates
+from parsers.movimientos_mp_parser import parse_transactions_from_mp
+from parsers.movimientos_santander_parser import parse_movimientos_santander
+from parsers.visa_resumen_parser import create_df_from_pdf
+from benchmarks import generators
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+WORK_DIR = os.path.join(tempfile.gettempdir(), 'pfinance-benchmarks')
+DEFAULT_SIZES = [1000, 10000]
+DEFAULT_KEYWORDS = [10, 100]
+STUB_USD_RATE = 1000.0
+STAGES = ['santander', 'visa', 'mp', 'add_tags', 'concat_by_id']
+
+
+@contextmanager
+def offline_backends():
+    '''The visa case gets the rate through rate_provider, any other network access is an error.
+    The patches only last while the benchmarks run'''
+    def offline(*args, **kwargs):
+        raise RuntimeError("benchmarks run offline, Google Sheets and dolarapi are stubbed")
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(spreadsheets, 'get_data_from_spreadsheet', offline))
+        stack.enter_context(patch.object(local_cache, 'get_data_from_spreadsheet', offline))
+        stack.enter_context(patch.object(usd_rates.requests, 'get', offline))
+        yield
+
+
+def input_file(kind, n, generate):
+    '''generated once per size, the big ones take a while'''
+    os.makedirs(WORK_DIR, exist_ok=True)
+    extension = 'xlsx' if kind == 'santander' else 'pdf'
+    path = os.path.join(WORK_DIR, f"{kind}-{n}.{extension}")
+    if not os.path.exists(path):
+        generate(path, n, generators.rng_for(kind, n))
+    return path
+
+
+def santander_case(n, _):
+    path = input_file('santander', n, generators.santander_xlsx)
+    return lambda: parse_movimientos_santander(path)
+
+
+def visa_case(n, _):
+    path = input_file('visa', n, generators.visa_pdf)
+    return lambda: create_df_from_pdf(path, rate_provider=lambda rate_date=None: STUB_USD_RATE)
+
+
+def mp_case(n, _):
+    path = input_file('mp', n, generators.mp_pdf)
+    return lambda: parse_transactions_from_mp(path)
+
+
+def add_tags_case(n, keywords):
+    data = app.parse_movimientos(generators.movimientos_frame(n, generators.rng_for('movimientos', n)))
+    tags_map = generators.tags_map(keywords, generators.rng_for('tags', keywords))
+
+    def run():
+        # sin memo: mide la categorizacion completa, como al abrir una sesion nueva
+        st.session_state.pop('categorization_memo', None)
+        st.session_state.movimientos = data.copy(deep=False)
+        app.add_tags(tags_map=tags_map, col_name='categoria')
+    return run
+
+
+def concat_by_id_case(n, _):
+    stored = app.parse_movimientos(generators.movimientos_frame(n, generators.rng_for('movimientos', n)))
+    # la mitad de los movimientos nuevos ya estan guardados
+    new_rows = generators.movimientos_frame(max(1, n // 10), generators.rng_for('new', n), first_id=n - n // 20)
+    return lambda: app.concat_by_id(stored, new_rows)
+
+
+CASES = {'santander': santander_case, 'visa': visa_case, 'mp': mp_case,
+         'add_tags': add_tags_case, 'concat_by_id': concat_by_id_case}
+
+
+def measure(run, repeat):
+    '''best time of repeat runs, then one more run under tracemalloc for the peak'''
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = run()
+        seconds.append(time.perf_counter() - start)
+    rows = len(result) if result is not None else None
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': min(seconds), 'peak_mb': peak / 1e6, 'rows': rows}
+
+
+def run_benchmarks(stages, sizes, keywords, repeat):
+    results = {}
+    for stage in stages:
+        for n in sizes:
+            for k in (keywords if stage == 'add_tags' else [None]):
+                key = f"{stage}/{n}" + (f"/{k}kw" if k else "")
+                results[key] = measure(CASES[stage](n, k), repeat)
+                result = results[key]
+                print(f"{key:<28} {result['seconds']:>9.3f}s {result['peak_mb']:>9.1f} MB {result['rows'] or '':>9} rows", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''keys slower than baseline * (1 + tolerance), printed as a table'''
+    regressions = []
+    print(f"\n{'case':<28} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[key]['seconds'] if baseline[key]['seconds'] else float('inf')
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<28} {baseline[key]['seconds']:>9.3f}s {result['seconds']:>9.3f}s {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="transactions per input")
+    parser.add_argument('--keywords', nargs='+', type=int, default=DEFAULT_KEYWORDS, help="keywords in the tag map (add_tags)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="merge the results into the baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+    with offline_backends():
+        results = run_benchmarks(args.stages, args.sizes, args.keywords, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nbaseline saved to {args.baseline}")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
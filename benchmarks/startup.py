@@ -0,0 +1,85 @@
+'''Cold start of the app: time to import it, measured with python -X importtime in a fresh interpreter.
+
+    python -m benchmarks.startup                   # compares with benchmarks/baseline.json
+    python -m benchmarks.startup --save-baseline
+    python -m benchmarks.startup --top 20          # the slowest direct imports of each module
+
+Besides the time, importing the app must not load the dependencies that are only needed
+to parse a file or to talk to Google Sheets (LAZY_MODULES), that is reported as a regression too'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.run import BASELINE_FILE, compare
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['app', 'backfill']
+LAZY_MODULES = ['gspread', 'oauth2client', 'pdfplumber', 'openpyxl', 'requests', 'plotly.express']
+
+
+def import_times(module):
+    '''{imported module: (cumulative microseconds, depth)} of one import in a new interpreter'''
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                             cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(cumulative), depth)
+    return times
+
+
+def measure(module, repeat):
+    '''best of repeat runs, the first one also compiles the .pyc files'''
+    runs = [import_times(module) for _ in range(repeat)]
+    times = min(runs, key=lambda run: run[module][0])
+    return {'seconds': times[module][0] / 1e6, 'eager': [name for name in LAZY_MODULES if name in times]}, times
+
+
+def slowest_imports(times, top):
+    direct = [(name, cumulative) for name, (cumulative, depth) in times.items() if depth == 1]
+    return sorted(direct, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help="print the slowest direct imports of each module")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="merge the results into the baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    results, eager = {}, []
+    for module in args.modules:
+        key = f"startup/{module}"
+        results[key], times = measure(module, args.repeat)
+        print(f"{key:<28} {results[key]['seconds']:>9.3f}s", flush=True)
+        for name, cumulative in slowest_imports(times, args.top):
+            print(f"    {name:<36} {cumulative / 1e6:>7.3f}s")
+        if results[key]['eager']:
+            eager.append(key)
+            print(f"    imported at startup: {', '.join(results[key]['eager'])}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nbaseline saved to {args.baseline}")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    return 1 if regressions or eager else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+IGNORE_TAG = 'ignore'
+
+
+def tags_map_key(tags_map):
+    '''only the tags order matters, inside a tag every keyword gives the same result'''
+    return tuple((tag, tuple(sorted(set(keywords)))) for tag, keywords in tags_map.items())
+
+
+@lru_cache(maxsize=8)
+def _compile(key):
+    tags, alternatives, keywords, ignore_priorities = [], [], [], {}
+    for tag, tag_keywords in key:
+        for keyword in tag_keywords:
+            priority = len(tags)
+            tags.append(tag)
+            if tag == IGNORE_TAG:
+                ignore_priorities[keyword.lower()] = priority
+            else:
+                keywords.append((priority, keyword))
+
+    # la ultima keyword que matchea gana, asi que se prueban de mayor a menor prioridad
+    for priority, keyword in reversed(keywords):
+        alternatives.append(f"(?=.*?(?P<k{priority}>{keyword}))")
+    try:
+        pattern = re.compile(f"^(?:{'|'.join(alternatives)})", re.IGNORECASE | re.DOTALL) if alternatives else None
+        keywords = []
+    except re.error:
+        pattern = None
+        keywords = [(priority, re.compile(keyword, re.IGNORECASE)) for priority, keyword in reversed(keywords)]
+    return {'pattern': pattern, 'keywords': keywords, 'tags': tags, 'ignore': ignore_priorities}
+
+
+def compile_tags_map(tags_map):
+    '''Builds the matcher for a {tag: [keywords]} map.
+    Keywords are regex searched case insensitive, except the 'ignore' ones that must be an exact match'''
+    return _compile(tags_map_key(tags_map))
+
+
+def _keyword_priority(name, matcher):
+    if matcher['pattern'] is not None:
+        match = matcher['pattern'].match(name)
+        return int(match.lastgroup[1:]) if match else np.nan
+    for priority, keyword in matcher['keywords']:
+        if keyword.search(name):
+            return priority
+    return np.nan
+
+
+def match_names(names, matcher):
+    '''Returns the winning tag for every name, NaN where no keyword matches'''
+    priorities = names.str.lower().map(matcher['ignore']).astype(float)
+    keyword_priorities = names.map(lambda name: _keyword_priority(name, matcher), na_action='ignore').astype(float)
+    priorities = np.fmax(priorities.to_numpy(), keyword_priorities.to_numpy())
+    tags = np.array(matcher['tags'] + [np.nan], dtype=object)
+    priorities = np.where(np.isnan(priorities), len(matcher['tags']), priorities).astype(int)
+    return pd.Series(tags[priorities], index=names.index)
+
+
+def match_names_memoized(names, tags_map, memo):
+    '''Like match_names, but only the names missing from memo are matched.
+    memo is a dict kept by the caller, reset when tags_map changes without going through invalidate_names'''
+    key = tags_map_key(tags_map)
+    if memo.get('key') != key:
+        memo['key'], memo['labels'] = key, {}
+    labels = memo['labels']
+
+    codes, uniques = pd.factorize(names)
+    missing = [name for name in uniques if name not in labels]
+    if missing:
+        labels.update(zip(missing, match_names(pd.Series(missing, dtype=object), compile_tags_map(tags_map))))
+    unique_labels = np.array([labels[name] for name in uniques] + [np.nan], dtype=object)
+    return pd.Series(unique_labels[codes], index=names.index)
+
+
+def invalidate_names(memo, tags_map, tag, keywords):
+    '''Forgets the names that the new keywords of tag can match and adopts the updated tags_map'''
+    labels = memo.get('labels', {})
+    if tag == IGNORE_TAG:
+        lowered = {keyword.lower() for keyword in keywords}
+        affected = [name for name in labels if name.lower() in lowered]
+    else:
+        patterns = [re.compile(keyword, re.IGNORECASE) for keyword in keywords]
+        affected = [name for name in labels if any(pattern.search(name) for pattern in patterns)]
+    for name in affected:
+        del labels[name]
+    memo['key'], memo['labels'] = tags_map_key(tags_map), labels
@@ -0,0 +1,52 @@
+import pandas as pd
+
+
+def normalize_ids(ids):
+    '''parsers return ids as int or str, the stored ones are always str (missing ones as 'None')'''
+    return ids.astype(object).where(ids.notna(), None).astype(str)
+
+
+def build_id_index(df):
+    '''{id: [index labels of its rows]}, df must have a unique index.
+    Several rows can share an id, the ones without id are all 'None' '''
+    id_index = {}
+    if 'id' in df.columns:
+        for row_id, label in zip(normalize_ids(df['id']), df.index):
+            id_index.setdefault(row_id, []).append(label)
+    return id_index
+
+
+def _next_label(df):
+    return int(df.index.max()) + 1 if len(df) else 0
+
+
+def merge_by_id(df, frames, id_index=None):
+    '''Same result as chaining concat_by_id over frames: df data is preserved,
+    and an id already in id_index (built from df when not given) is not added again.
+    The new rows get the labels after the last one of df and are added to id_index'''
+    if id_index is None:
+        id_index = build_id_index(df)
+    new_frames, next_label = [], _next_label(df)
+    for frame in frames:
+        if frame.empty:
+            continue
+        ids = normalize_ids(frame['id'])
+        is_new = [row_id not in id_index for row_id in ids]
+        new_ids = ids[is_new]
+        labels = range(next_label, next_label + len(new_ids))
+        for row_id, label in zip(new_ids, labels):
+            id_index.setdefault(row_id, []).append(label)
+        new_frames.append(frame[is_new].set_axis(labels))
+        next_label += len(new_ids)
+    frames = [f for f in [df] + new_frames if not f.empty]
+    if not frames:
+        return df
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+
+def drop_ids(df, id_index, ids):
+    '''the rows are found through id_index, the column is not scanned'''
+    labels = [label for row_id in {str(row_id) for row_id in ids} for label in id_index.pop(row_id, ())]
+    if not labels:
+        return df
+    return df.drop(index=labels)
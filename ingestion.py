@@ -0,0 +1,113 @@
+import importlib
+import importlib.util
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+
+from local_cache import parse_file_cached, read_parsed_cache
+from profiling import capture_stages, record
+
+FILES_DIR = 'files'
+INGEST_WORKERS = os.cpu_count() or 1
+# los parsers (openpyxl, pdfplumber, requests) se importan recien cuando llega un archivo suyo
+PARSERS = {
+    'santander': ('parsers.movimientos_santander_parser', 'parse_movimientos_santander'),
+    'visa': ('parsers.visa_resumen_parser', 'create_df_from_pdf'),
+    'mp': ('parsers.movimientos_mp_parser', 'parse_transactions_from_mp'),
+}
+XLS_READERS = ('python_calamine', 'xlrd')
+
+
+@lru_cache(maxsize=None)
+def can_read_xls():
+    '''openpyxl doesn't read .xls, one of XLS_READERS has to be installed'''
+    return any(importlib.util.find_spec(name) is not None for name in XLS_READERS)
+
+
+def parser_kind(file_name):
+    '''key of PARSERS for the file, by name only, nothing is imported.
+    .xls files are ignored, like any other unknown file, when there is nothing to read them with'''
+    if file_name.endswith(".db"):
+        return None
+    if 'movimientos' in file_name and (file_name.endswith(".xlsx") or (file_name.endswith(".xls") and can_read_xls())):
+        return 'santander'
+    elif "Resumen de tarjeta de crédito" in file_name:
+        return 'visa'
+    elif "download" in file_name or "mp-wallet" in file_name:
+        return 'mp'
+    return None
+
+
+def load_parser(kind):
+    module_name, function_name = PARSERS[kind]
+    module = importlib.import_module(module_name)
+    return getattr(module, function_name), module.PARSER_VERSION
+
+
+def get_parser(file_name):
+    '''(parser, parser version) for the file, its module is imported on the first call'''
+    kind = parser_kind(file_name)
+    return load_parser(kind) if kind else None
+
+
+def parse_file(file_name, file_bytes):
+    parser, parser_version = get_parser(file_name)
+    start = time.perf_counter()
+    with capture_stages() as stages:
+        df = parse_file_cached(file_bytes, os.path.join(FILES_DIR, file_name), parser, parser_version)
+    return {'file': file_name, 'parser': parser.__name__, 'rows': len(df),
+            'seconds': time.perf_counter() - start, 'data': df, 'stages': stages}
+
+
+def cached_result(file_name, file_bytes):
+    '''the result of parse_file when the file is in the parse cache, None otherwise'''
+    parser, parser_version = get_parser(file_name)
+    start = time.perf_counter()
+    df = read_parsed_cache(file_bytes, parser, parser_version)
+    if df is None:
+        return None
+    return {'file': file_name, 'parser': parser.__name__, 'rows': len(df),
+            'seconds': time.perf_counter() - start, 'data': df, 'stages': []}
+
+
+def parse_file_or_error(file_name, file_bytes):
+    '''like parse_file, a file that can't be parsed gives a result with its error instead of raising'''
+    try:
+        return parse_file(file_name, file_bytes)
+    except Exception as e:
+        return {'file': file_name, 'error': f"{type(e).__name__}: {e}", 'stages': []}
+
+
+def parse_files(files, workers=INGEST_WORKERS, keep_going=False):
+    '''files is a list of (file_name, file_bytes) with a known parser, results keep the same order.
+    With keep_going the files that fail are returned with an 'error' instead of stopping the batch.
+    Files already in the parse cache are read here, only the rest go to the worker processes'''
+    os.makedirs(FILES_DIR, exist_ok=True)
+    parse = parse_file_or_error if keep_going else parse_file
+    results = [cached_result(file_name, file_bytes) for file_name, file_bytes in files]
+    misses = [(i, file) for i, (file, result) in enumerate(zip(files, results)) if result is None]
+    if workers <= 1 or len(misses) <= 1:
+        parsed = [parse(file_name, file_bytes) for _, (file_name, file_bytes) in misses]
+    else:
+        # spawn: un fork dentro del servidor de Streamlit copia locks tomados por otros threads
+        with ProcessPoolExecutor(max_workers=min(workers, len(misses)), mp_context=multiprocessing.get_context('spawn')) as executor:
+            parsed = list(executor.map(parse, *zip(*[file for _, file in misses])))
+    for (i, _), result in zip(misses, parsed):
+        results[i] = result
+    return _record_stages(results)
+
+
+def _record_stages(results):
+    '''the parser stages are timed where the file was parsed, maybe a worker process'''
+    for result in results:
+        for name, seconds in result['stages']:
+            record(f"{result['file']}: {name}", seconds)
+    return results
+
+
+def ingestion_report(results):
+    return pd.DataFrame([{k: v for k, v in result.items() if k not in ('data', 'stages')} for result in results])
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from parsers.schema import enforce_schema
+from spreadsheets import get_data_from_spreadsheet, spreadsheets_to_pandas
+
+
+CACHE_DIR = os.path.join('files', 'cache')
+PARSED_DIR = os.path.join('files', 'parsed')
+REVALIDATE_SECONDS = 60
+
+_frames = {}
+
+
+def _cache_paths(sheet_name):
+    return os.path.join(CACHE_DIR, f"{sheet_name}.parquet"), os.path.join(CACHE_DIR, f"{sheet_name}.json")
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, modified_time):
+    with open(meta_path, 'w') as f:
+        json.dump({'modified_time': modified_time, 'checked_at': time.time()}, f)
+
+
+def write_cached_sheet(sheet_name, df, modified_time=None):
+    '''modified_time is the sheet version the data belongs to, fetched from Drive when not given'''
+    if modified_time is None:
+        modified_time = get_data_from_spreadsheet().get_lastUpdateTime()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data_path, meta_path = _cache_paths(sheet_name)
+    tmp_path = f"{data_path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, data_path)
+    _frames[sheet_name] = (os.stat(data_path).st_mtime_ns, df)
+    _write_meta(meta_path, modified_time)
+
+
+def _read_parquet(sheet_name, data_path):
+    '''The last frame read or written stays in memory while the file doesn't change.
+    It is shared, callers must not modify it in place'''
+    mtime = os.stat(data_path).st_mtime_ns
+    cached = _frames.get(sheet_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    # parquet devuelve los strings de arrow como string[python]
+    df = enforce_schema(pd.read_parquet(data_path))
+    _frames[sheet_name] = (mtime, df)
+    return df
+
+
+def _read_fresh_cache(sheet_name, force=False):
+    '''Returns (cached frame or None, spreadsheet modifiedTime if it had to be checked)'''
+    data_path, meta_path = _cache_paths(sheet_name)
+    meta = _read_meta(meta_path)
+    if force or not meta or not os.path.exists(data_path):
+        return None, None
+    if time.time() - meta['checked_at'] < REVALIDATE_SECONDS:
+        return _read_parquet(sheet_name, data_path), None
+    modified_time = get_data_from_spreadsheet().get_lastUpdateTime()
+    if modified_time == meta['modified_time']:
+        _write_meta(meta_path, modified_time)
+        return _read_parquet(sheet_name, data_path), None
+    return None, modified_time
+
+
+def read_sheets(sheet_names, parsers=None, cached=(), force=False):
+    '''Reads every sheet in a single values_batchGet request and applies its parser.
+    Sheets listed in cached are served from the local copy while the spreadsheet didn't change'''
+    parsers = parsers or {}
+    result, modified_time = {}, None
+    for sheet_name in cached:
+        df, checked_time = _read_fresh_cache(sheet_name, force)
+        modified_time = checked_time or modified_time
+        if df is not None:
+            result[sheet_name] = df
+
+    missing = [sheet_name for sheet_name in sheet_names if sheet_name not in result]
+    if missing:
+        if modified_time is None and any(sheet_name in cached for sheet_name in missing):
+            # se toma la version antes de leer, asi un cambio durante la descarga invalida el cache
+            modified_time = get_data_from_spreadsheet().get_lastUpdateTime()
+        for sheet_name, df in spreadsheets_to_pandas(missing).items():
+            if parsers.get(sheet_name):
+                df = parsers[sheet_name](df)
+            if sheet_name in cached:
+                write_cached_sheet(sheet_name, df, modified_time)
+            result[sheet_name] = df
+    return result
+
+
+def synced_copy(sheet_name):
+    '''The local copy of the sheet while it still is the spreadsheet's current version, None otherwise'''
+    data_path, meta_path = _cache_paths(sheet_name)
+    meta = _read_meta(meta_path)
+    if not meta or not os.path.exists(data_path):
+        return None
+    if get_data_from_spreadsheet().get_lastUpdateTime() != meta['modified_time']:
+        return None
+    return _read_parquet(sheet_name, data_path)
+
+
+def read_cached_sheet(sheet_name, parse=None, force=False):
+    '''Returns the sheet from the local cache, downloading it only when the spreadsheet changed'''
+    return read_sheets([sheet_name], parsers={sheet_name: parse}, cached=[sheet_name], force=force)[sheet_name]
+
+
+def _write_temp(directory, suffix, write):
+    '''path of a new file in directory with what write(file) wrote, to be moved to its final name'''
+    with tempfile.NamedTemporaryFile(dir=directory or '.', suffix=suffix, delete=False) as f:
+        write(f)
+    return f.name
+
+
+def _parsed_cache_path(file_bytes, parser, parser_version):
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    return os.path.join(PARSED_DIR, f"{digest}-{parser.__name__}-v{parser_version}.parquet")
+
+
+def read_parsed_cache(file_bytes, parser, parser_version):
+    '''what parse_file_cached returns for the file when it was already parsed, None otherwise'''
+    cache_path = _parsed_cache_path(file_bytes, parser, parser_version)
+    if os.path.exists(cache_path):
+        return enforce_schema(pd.read_parquet(cache_path))
+    return None
+
+
+def parse_file_cached(file_bytes, file_path, parser, parser_version):
+    '''Parses the file once per content: the result is kept by sha256 of the bytes and the parser version'''
+    df = read_parsed_cache(file_bytes, parser, parser_version)
+    if df is not None:
+        return df
+    cache_path = _parsed_cache_path(file_bytes, parser, parser_version)
+
+    # nombres temporales unicos: dos archivos iguales o con el mismo nombre pueden llegar en el mismo lote
+    source_path = _write_temp(os.path.dirname(file_path), os.path.splitext(file_path)[1], lambda f: f.write(file_bytes))
+    try:
+        df = parser(source_path)
+    except Exception:
+        os.remove(source_path)
+        raise
+    os.replace(source_path, file_path)
+    os.makedirs(PARSED_DIR, exist_ok=True)
+    os.replace(_write_temp(PARSED_DIR, '.tmp', lambda f: df.to_parquet(f, index=False)), cache_path)
+    return df
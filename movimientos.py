@@ -0,0 +1,37 @@
+import pandas as pd
+
+from parsers.schema import MOVIMIENTOS_SCHEMA, enforce_schema
+
+
+MOVIMIENTOS = 'movimientos'
+
+
+def parse_movimientos(df):
+    if df.columns.empty:
+        # tabla todavia no creada (sqlite sin datos)
+        df = pd.DataFrame(columns=list(MOVIMIENTOS_SCHEMA))
+    df = df.astype(object).where(df.notna(), None).replace('', None)
+    if 'alias' not in df.columns:
+        df['alias'] = ""
+
+    df['date'] = pd.to_datetime(df['date'])
+    df['monto'] = df['monto'].astype(float)
+    df['alias'] = df['alias'].fillna('')
+    return enforce_schema(sort_by_date(order_df(df)), report_name=MOVIMIENTOS)
+
+
+def sort_by_date(df):
+    '''filter_data_by_date needs the rows sorted by date, with the rows without date at the end'''
+    dates = df['date']
+    valid_count = dates.notna().sum()
+    if dates.iloc[:valid_count].notna().all() and dates.iloc[:valid_count].is_monotonic_increasing:
+        return df
+    return df.sort_values('date', kind='stable', na_position='last', ignore_index=True)
+
+
+def order_df(df):
+    first_columns = ['date', 'nombre', 'monto', 'cuotas', 'alias']
+    remaining_columns = [col for col in df.columns if col not in first_columns]
+    column_order = first_columns + remaining_columns
+    df = df.reindex(columns=column_order)
+    return df
@@ -1,6 +1,10 @@
-import pdfplumber
 import pandas as pd
 import re
+from parsers.pdf_text import iter_pages_text
+from parsers.schema import enforce_schema
+from profiling import timed
+
+PARSER_VERSION = 2
 
 def create_lines_list_from_text(text):
     lines = text.split("\n")
@@ -17,12 +21,9 @@ def create_lines_list_from_text(text):
             transaction_part = []
     return transaction
 
+@timed('mp: pdf text')
 def extract_text_from_pdf(pdf_path):
-   with pdfplumber.open(pdf_path) as pdf:
-        text = ""
-        for page in pdf.pages:
-            text += page.extract_text()
-        return text
+    return "".join(iter_pages_text(pdf_path))
 
 def create_line_dict(line):
     if any('Transferencia enviada' in p for p in line) or any('Transferencia recibida' in p for p in line):
@@ -39,6 +40,7 @@ def parse_df(df):
     df['origen'] = 'MercadoPago'
     return df
 
+@timed('mp')
 def parse_transactions_from_mp(pdf_path):
     text = extract_text_from_pdf(pdf_path)
     lines = create_lines_list_from_text(text)
@@ -48,7 +50,7 @@ def parse_transactions_from_mp(pdf_path):
         if line_dict:
             lines_dict.append(line_dict)
 
-    return parse_df(pd.DataFrame(lines_dict))
+    return enforce_schema(parse_df(pd.DataFrame(lines_dict)))
 
 
 
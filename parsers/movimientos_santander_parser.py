@@ -1,48 +1,143 @@
+import re
+
+import numpy as np
 import pandas as pd
+from openpyxl import load_workbook
+from parsers.schema import enforce_schema
+from profiling import timed
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
 
+PARSER_VERSION = 3
 EXCLUDE_ROWS_CONTAINING = ["tarjeta de credito", " tarjeta credito",  "Acreditacion de haberes", "Impuesto de sellos", "ley27743", "interes por", "Impuesto ley"]
+EXCLUDE_PATTERN = re.compile('|'.join(map(re.escape, EXCLUDE_ROWS_CONTAINING)))
+TABLE_HEADER = ('Fecha', 'Sucursal origen')
+TABLE_COLUMNS = ['Fecha', 'Sucursal de Origen', 'Descripción', 'Referencia', 'Caja de Ahorro', 'Cuenta Corriente', 'Saldo']
+AMOUNT_COLUMNS = (4, 5)
 
-def read_excel_and_extract_table(file_path):
-    df = pd.read_excel(file_path, header=None, engine='openpyxl')
-    df.dropna(how='all', inplace=True)
-    df.dropna(axis=1, how='all', inplace=True)
-    df.reset_index(drop=True, inplace=True)
-
-    start_row, start_col = None, None
-    for i in range(df.shape[0]):
-        for j in range(df.shape[1]):
-            if df.iat[i, j] == 'Fecha' and df.iat[i, j + 1] == 'Sucursal origen':
-                start_row, start_col = i, j
-                break
-        if start_row is not None:
+
+def _integral(value):
+    '''calamine and xlrd return every number as float, read_excel gave ints for the integral ones'''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return None if value == '' else value
+
+
+def _openpyxl_sheets(file_path):
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            # algunos exportes declaran mal el rango usado
+            worksheet.reset_dimensions()
+            yield worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _calamine_sheets(file_path):
+    workbook = CalamineWorkbook.from_path(file_path)
+    for sheet_name in workbook.sheet_names:
+        yield ([_integral(value) for value in row] for row in workbook.get_sheet_by_name(sheet_name).to_python())
+
+
+def _xlrd_value(cell, datemode):
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        return xlrd.xldate_as_datetime(cell.value, datemode)
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+        return None
+    return _integral(cell.value)
+
+
+def _xlrd_sheets(file_path):
+    book = xlrd.open_workbook(file_path, on_demand=True)
+    for index in range(book.nsheets):
+        sheet = book.sheet_by_index(index)
+        yield ([_xlrd_value(cell, book.datemode) for cell in sheet.row(i)] for i in range(sheet.nrows))
+        book.unload_sheet(index)
+
+
+def iter_sheets(file_path):
+    '''The rows of every sheet, read with calamine when it is installed'''
+    if CalamineWorkbook is not None:
+        return _calamine_sheets(file_path)
+    if file_path.lower().endswith('.xls'):
+        if xlrd is None:
+            raise ImportError("Para leer archivos .xls hace falta instalar xlrd (o python-calamine)")
+        return _xlrd_sheets(file_path)
+    return _openpyxl_sheets(file_path)
+
+
+def find_table_columns(row):
+    '''Positions of the 7 table columns when row is the table header, None otherwise'''
+    cells = [(position, value) for position, value in enumerate(row) if value is not None and value != '']
+    for k in range(len(cells) - 1):
+        if cells[k][1] == TABLE_HEADER[0] and cells[k + 1][1] == TABLE_HEADER[1]:
+            return [position for position, _ in cells[k:k + len(TABLE_COLUMNS)]]
+    return None
+
+
+def _cell(row, position):
+    return row[position] if position < len(row) else None
+
+
+def extract_table(rows):
+    '''Table rows of one sheet, None when the sheet has no table.
+    Multi-account exports repeat the header before every account table'''
+    rows = iter(rows)
+    columns = None
+    for row in rows:
+        columns = find_table_columns(row)
+        if columns is not None:
             break
+    if columns is None:
+        return None
+
+    table = []
+    for row in rows:
+        values = [_cell(row, position) for position in columns]
+        if values[0] == TABLE_HEADER[0] and values[1] == TABLE_HEADER[1]:
+            continue
+        # filas vacias y titulos de cada cuenta: sin importe no es un movimiento
+        if all(values[position] in (None, '') for position in AMOUNT_COLUMNS):
+            continue
+        table.append(values)
+    return table
+
 
-    if start_row is None or start_col is None:
+@timed('santander: read excel')
+def read_excel_and_extract_table(file_path):
+    tables = [table for table in map(extract_table, iter_sheets(file_path)) if table is not None]
+    if not tables:
         raise ValueError("Table start not found")
+    rows = [row for table in tables for row in table]
 
-    table_df = df.iloc[start_row:, start_col:start_col + 7]
-    expected_columns = ['Fecha', 'Sucursal de Origen', 'Descripción', 'Referencia', 'Caja de Ahorro', 'Cuenta Corriente', 'Saldo']
-    table_df.columns = expected_columns
-    table_df.reset_index(drop=True, inplace=True)
-    table_df = table_df.drop(0).reset_index(drop=True)
+    table_df = pd.DataFrame(rows, columns=TABLE_COLUMNS, dtype=object)
+    return table_df.where(table_df.notna(), np.nan)
 
-    return table_df
 
 def parse_df(df):
-    df['date'] = pd.to_datetime(df['Fecha'], errors='coerce')
-    df = df[~df['Descripción'].str.contains('|'.join(EXCLUDE_ROWS_CONTAINING), na=False)]
-    df['monto'] = (df['Caja de Ahorro'].astype(float) * -1)
-    df['id'] = df['Referencia'].astype(str)
-    df['nombre'] = df['Descripción'].str.replace('Compra con tarjeta de debito ', '').str.strip()
-    df.drop(columns=['Sucursal de Origen', 'Cuenta Corriente', 'Saldo', 'Caja de Ahorro', 'Referencia', 'Fecha', 'Descripción'], inplace=True)
-    df = df[~df['nombre'].str.contains("Transf", na=False)]
-    df['origen'] = 'movimientos-santander'
-
-    return df
+    df = df[~df['Descripción'].str.contains(EXCLUDE_PATTERN, na=False)]
+    # las cuentas corrientes traen el importe en su propia columna
+    monto = df['Caja de Ahorro'].astype(float).fillna(df['Cuenta Corriente'].astype(float))
+    df = pd.DataFrame({
+        'date': pd.to_datetime(df['Fecha'], errors='coerce'),
+        'monto': monto * -1,
+        'id': df['Referencia'].astype(str),
+        'nombre': df['Descripción'].str.replace('Compra con tarjeta de debito ', '', regex=False).str.strip(),
+        'origen': 'movimientos-santander',
+    })
+    return df[~df['nombre'].str.contains("Transf", regex=False, na=False)]
 
 
+@timed('santander')
 def parse_movimientos_santander(file_path):
     table_df = read_excel_and_extract_table(file_path)
     df = parse_df(table_df)
-    return df
-
+    return enforce_schema(df)
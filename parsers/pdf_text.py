@@ -0,0 +1,36 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import pdfplumber
+
+PDF_WORKERS = os.cpu_count() or 1
+MIN_PAGES_FOR_POOL = 16
+
+
+def _extract_pages(pdf_path, start, stop):
+    with pdfplumber.open(pdf_path) as pdf:
+        return [pdf.pages[i].extract_text() for i in range(start, stop)]
+
+
+def iter_pages_text(pdf_path, workers=PDF_WORKERS):
+    '''Yields the text of every page in order.
+    Long files are split in chunks of pages that are extracted in a process pool'''
+    if multiprocessing.parent_process() is not None:
+        # ya estamos en un worker (varios archivos en paralelo), no se abre otro pool
+        workers = 1
+    with pdfplumber.open(pdf_path) as pdf:
+        pages_count = len(pdf.pages)
+        if workers <= 1 or pages_count < MIN_PAGES_FOR_POOL:
+            for page in pdf.pages:
+                yield page.extract_text()
+            return
+
+    chunk_size = -(-pages_count // (workers * 4))
+    starts = range(0, pages_count, chunk_size)
+    stops = [min(start + chunk_size, pages_count) for start in starts]
+    # spawn, como en ingestion: no se hace fork del servidor de Streamlit
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        for texts in executor.map(_extract_pages, repeat(pdf_path), starts, stops):
+            yield from texts
@@ -0,0 +1,25 @@
+MOVIMIENTOS_SCHEMA = {
+    'date': 'datetime64[ns]',
+    'nombre': 'string[pyarrow]',
+    'monto': 'float64',
+    'cuotas': 'category',
+    'alias': 'category',
+    'categoria': 'category',
+    'origen': 'category',
+    'id': 'string[pyarrow]',
+}
+
+memory_reports = {}
+
+
+def enforce_schema(df, report_name=None):
+    '''Casts the schema columns present in df, missing ones are not added.
+    With report_name the memory used before and after is kept in memory_reports'''
+    if report_name:
+        before = df.memory_usage(deep=True).sum()
+    dtypes = {col: dtype for col, dtype in MOVIMIENTOS_SCHEMA.items() if col in df.columns and df[col].dtype != dtype}
+    if dtypes:
+        df = df.astype(dtypes)
+    if report_name:
+        memory_reports[report_name] = (before, df.memory_usage(deep=True).sum())
+    return df
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+import time
+
+import requests
+
+RATES_URL = "https://dolarapi.com/v1/dolares/blue"
+HISTORICAL_RATES_URL = "https://api.argentinadatos.com/v1/cotizaciones/dolares/blue/{date}"
+RATES_CACHE_FILE = os.path.join('files', 'cache', 'usd_rates.json')
+OFFLINE_RATES_FILE = os.path.join('files', 'usd_rates.json')
+RATES_TTL_SECONDS = 6 * 60 * 60
+REQUEST_TIMEOUT = 5
+OFFLINE = os.environ.get('PFINANCE_OFFLINE') == '1'
+
+
+def _date_key(rate_date):
+    if rate_date is None:
+        return 'latest'
+    return rate_date if isinstance(rate_date, str) else rate_date.strftime('%Y-%m-%d')
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    cache_dir = os.path.dirname(RATES_CACHE_FILE)
+    os.makedirs(cache_dir, exist_ok=True)
+    # nombre temporal unico: los workers de la ingesta pueden guardar a la vez
+    with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix='.tmp', delete=False) as f:
+        json.dump(cache, f)
+    os.replace(f.name, RATES_CACHE_FILE)
+
+
+def _previous_cached_rate(cache, key):
+    '''rate of the closest cached date before key, None when there is none'''
+    previous = [k for k in cache if k != 'latest' and k < key]
+    return cache[max(previous)]['rate'] if previous else None
+
+
+def fetch_rate(rate_date=None, timeout=REQUEST_TIMEOUT):
+    '''blue dollar, average of compra and venta'''
+    url = RATES_URL if rate_date is None else HISTORICAL_RATES_URL.format(date=_date_key(rate_date).replace('-', '/'))
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    usd_data = response.json()
+    return (usd_data["compra"] + usd_data["venta"]) / 2
+
+
+def read_offline_rate(rate_date=None, rates_file=OFFLINE_RATES_FILE):
+    '''rates_file is a json like {"latest": 1200.5, "2025-01-06": 1180.0}.
+    A date without a rate uses the closest previous one'''
+    rates = _load_json(rates_file)
+    if rate_date is not None:
+        key = _date_key(rate_date)
+        previous = [k for k in rates if k != 'latest' and k <= key]
+        if previous:
+            return rates[max(previous)]
+    if 'latest' not in rates:
+        raise ValueError(f"No USD rate for {_date_key(rate_date)} in {rates_file}")
+    return rates['latest']
+
+
+def get_usd_to_ars(rate_date=None, offline=OFFLINE, timeout=REQUEST_TIMEOUT, fetch=fetch_rate):
+    '''Rate for rate_date (today when None), cached on disk.
+    Historical rates never expire, the current one lasts RATES_TTL_SECONDS.
+    When the API fails without a cached value: a date uses the closest cached date before it,
+    then the local rates file, and at last the current rate (a date not published yet)'''
+    if offline:
+        return read_offline_rate(rate_date)
+
+    key = _date_key(rate_date)
+    cache = _load_json(RATES_CACHE_FILE)
+    entry = cache.get(key)
+    if entry and (key != 'latest' or time.time() - entry['fetched_at'] < RATES_TTL_SECONDS):
+        return entry['rate']
+
+    try:
+        rate = fetch(rate_date, timeout=timeout)
+    except (requests.RequestException, KeyError, ValueError):
+        if entry:
+            return entry['rate']
+        if rate_date is not None and _previous_cached_rate(cache, key) is not None:
+            return _previous_cached_rate(cache, key)
+        if os.path.exists(OFFLINE_RATES_FILE):
+            return read_offline_rate(rate_date)
+        if rate_date is not None:
+            return get_usd_to_ars(None, offline=offline, timeout=timeout, fetch=fetch)
+        raise
+    cache[key] = {'rate': rate, 'fetched_at': time.time()}
+    _save_cache(cache)
+    return rate
@@ -1,16 +1,24 @@
-import pdfplumber
 import pandas as pd
 import re
-import requests
-from datetime import datetime
+from parsers.pdf_text import iter_pages_text
+from parsers.usd_rates import get_usd_to_ars
+from parsers.schema import enforce_schema
+from profiling import stage, timed
 
+PARSER_VERSION = 4
 MONTHS = ("enero", "febrero", "marzo", "abril", "mayo", "junio", "julio", "agosto", "septie.", "octubre", "noviem.", "diciem.")
-
-
-def transform_usd_to_ars(data):
-    usd_data = requests.get("https://dolarapi.com/v1/dolares/blue").json()
-    usd_to_ars = (usd_data["compra"] + usd_data["venta"]) / 2
-    data['monto'] = data.apply(lambda row: row['monto'] * usd_to_ars if "usd" in row['nombre'].lower() else row['monto'], axis=1)
+SINGLE_CHAR_TOKEN = r'(?<!\S)\S(?!\S)'
+CONSUMO_TAIL = r'^(?P<body>.*?)(?: C\.(?P<cuotas>\d{2}/\d{2}))? (?P<monto>\S+)$'
+CONSUMO_BODY = r'^(?:(?P<pre>.*) )?(?P<day>\d{2}) (?P<id>\d{6}) (?P<nombre>.+)$'
+CONSUMO_HEADER = r'^(?P<year>\d{2}) (?P<month>\S+) '
+
+
+def transform_usd_to_ars(data, rate_provider=get_usd_to_ars, rate_date=None):
+    is_usd = data['nombre'].str.lower().str.contains("usd", regex=False)
+    if not is_usd.any():
+        return data
+    usd_to_ars = rate_provider(rate_date)
+    data.loc[is_usd, 'monto'] = data.loc[is_usd, 'monto'] * usd_to_ars
     return data
 
 def is_two_digit_number(text):
@@ -74,34 +82,55 @@ def get_month(month):
 
 
 def get_consumos_from_file(pdf_path):
-    with pdfplumber.open(pdf_path) as pdf:
-
-        consumos = []
-        for page in pdf.pages:
-            text = page.extract_text()
-            if cons := get_consumos(text):
-                consumos.extend(cons)
-        return consumos
-
-
-def create_df_from_pdf(pdf_path):
-    consumos_list = [parse_consumo(c) for c in get_consumos_from_file(pdf_path)]
-    year, month = None, None
-    for consumo in consumos_list[::-1]:
-        if consumo.get("year"):
-            month = get_month(consumo.get("month"))
-            year = consumo.get("year")
+    for text in iter_pages_text(pdf_path):
+        yield from get_consumos(text)
+
+
+def parse_consumos(consumos):
+    '''Batch version of parse_consumo plus the year/month carry forward of the statement.
+    Lines the regexes don't understand go through parse_consumo'''
+    raw_lines = pd.Series(list(consumos), dtype=object)
+    # parse_consumo descarta los tokens de un solo caracter
+    lines = raw_lines.str.replace(SINGLE_CHAR_TOKEN, '', regex=True).str.split().str.join(' ')
+    tail = lines.str.extract(CONSUMO_TAIL)
+    body = tail['body'].str.extract(CONSUMO_BODY)
+    header = lines.str.extract(CONSUMO_HEADER)
+    matched = body['day'].notna()
+    has_month = matched & header['month'].str[0].str.isupper().eq(True)
+
+    df = pd.DataFrame({
+        'monto': tail['monto'].where(matched).str.replace('.', '', regex=False).str.replace(',', '.', regex=False).astype(float),
+        'cuotas': tail['cuotas'].where(matched).fillna(''),
+        'day': body['day'],
+        'id': body['id'],
+        'month': header['month'].where(has_month).str.replace('.', '', regex=False),
+        'year': header['year'].where(has_month),
+        'nombre': body['nombre'].str.replace(' ', '-', regex=False),
+    })
+    if not matched.all():
+        fallback = pd.DataFrame([parse_consumo(c) for c in raw_lines[~matched]], index=raw_lines.index[~matched])
+        df.loc[~matched] = fallback.reindex(columns=df.columns)
+
+    # el año y mes aparecen solo en el primer consumo de cada mes, los siguientes (hacia arriba) lo heredan
+    has_year = df['year'].notna()
+    month = df['month'].where(has_year).map(lambda m: get_month(m) or 0, na_action='ignore').astype('Int64')
+    year = df['year'].where(has_year).astype('string').bfill()
+    df['date'] = pd.to_datetime(year.astype(str) + '-' + month.bfill().astype(str) + '-' + df['day'].astype(str), format="%y-%m-%d")
+    df.drop(columns=["month", "year", "day"], inplace=True)
+    return df
 
-        consumo["date"] = datetime.strptime(f"{year}-{month}-{consumo.get('day')}", "%y-%m-%d")
 
-    df = pd.DataFrame(consumos_list)
-    df['date'] = pd.to_datetime(df['date'])
-    df.drop(columns=["month", "year", "day"], inplace=True)
-    df["monto"] = df["monto"].astype(float)
-    df = transform_usd_to_ars(df)
+@timed('visa')
+def create_df_from_pdf(pdf_path, rate_provider=get_usd_to_ars, rate_date=None):
+    '''the USD consumos are converted at the rate of rate_date, by default the last consumo of the statement'''
+    df = parse_consumos(get_consumos_from_file(pdf_path))
+    if rate_date is None and df['date'].notna().any():
+        rate_date = df['date'].max()
+    with stage('visa: usd to ars'):
+        df = transform_usd_to_ars(df, rate_provider, rate_date)
     df['origen'] = "visa"
 
-    return df
+    return enforce_schema(df)
 
 
 def chech_total_amounts():
@@ -0,0 +1,126 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+
+# '' apagado, '1' tiempos por etapa y contadores de Sheets,
+# 'cprofile' o 'pyinstrument' ademas guardan el perfil de cada rerun en PROFILES_DIR
+PROFILE = os.environ.get('PFINANCE_PROFILE', '')
+ENABLED = PROFILE not in ('', '0')
+PROFILES_DIR = os.path.join('files', 'profiles')
+
+_run = threading.local()
+_sheets = {'calls': 0, 'bytes_sent': 0, 'bytes_received': 0}
+_sheets_lock = threading.Lock()
+_NO_OP = nullcontext()
+
+
+def run_stages():
+    '''(stage, seconds) recorded by this thread since the run started'''
+    if not hasattr(_run, 'stages'):
+        _run.stages = []
+    return _run.stages
+
+
+def record(name, seconds):
+    run_stages().append((name, seconds))
+
+
+@contextmanager
+def _timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def stage(name):
+    '''with stage('add_tags'): ... times the block. When profiling is off it is a shared no-op'''
+    return _timer(name) if ENABLED else _NO_OP
+
+
+def timed(name):
+    '''decorator version of stage, the function is returned untouched when profiling is off'''
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def capture_stages():
+    '''Collects apart the stages recorded inside the block, the ingestion workers send them back with the result'''
+    outer, _run.stages = run_stages(), []
+    try:
+        yield _run.stages
+    finally:
+        _run.stages = outer
+
+
+def count_sheets_response(response, *args, **kwargs):
+    '''requests response hook installed on the gspread session'''
+    body = response.request.body
+    with _sheets_lock:
+        _sheets['calls'] += 1
+        _sheets['bytes_sent'] += len(body) if body else 0
+        _sheets['bytes_received'] += len(response.content)
+
+
+def sheets_counters():
+    with _sheets_lock:
+        return dict(_sheets)
+
+
+def _start_profiler():
+    if PROFILE == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        except ImportError:
+            pass  # pyinstrument es opcional, se usa cProfile
+    if PROFILE in ('cprofile', 'pyinstrument'):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    return None
+
+
+def _save_profile(profiler, name):
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    path = os.path.join(PROFILES_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(f"{path}.prof")
+    else:
+        profiler.stop()
+        with open(f"{path}.html", 'w') as f:
+            f.write(profiler.output_html())
+
+
+@contextmanager
+def profile_run(name='rerun'):
+    '''Starts a new list of stages for the run and, with cprofile/pyinstrument, saves its profile'''
+    _run.stages = []
+    if not ENABLED:
+        yield _run.stages
+        return
+    profiler = _start_profiler()
+    start = time.perf_counter()
+    try:
+        yield _run.stages
+    finally:
+        record('total', time.perf_counter() - start)
+        if profiler is not None:
+            _save_profile(profiler, name)
@@ -0,0 +1,35 @@
+import pandas as pd
+
+ROLLUP_KEYS = ['month', 'categoria', 'nombre', 'alias']
+
+
+def _aggregate(df, count):
+    return df.groupby(ROLLUP_KEYS, dropna=False, sort=False, observed=True).agg(
+        monto=('monto', 'sum'), monto_abs=('monto_abs', 'sum'), count=count).reset_index()
+
+
+def build_rollup(df):
+    '''Sums and counts per (month, categoria, nombre, alias).
+    monto_abs is the sum of the absolute values, that is what the category pie shows'''
+    df = df.assign(month=df['date'].dt.to_period('M'), monto_abs=df['monto'].abs())
+    return _aggregate(df, ('monto', 'size'))
+
+
+def update_rollup(rollup, new_rows):
+    if new_rows.empty:
+        return rollup
+    if rollup.empty:
+        return build_rollup(new_rows)
+    return _aggregate(pd.concat([rollup, build_rollup(new_rows)]), ('count', 'sum'))
+
+
+def month_range(start_datetime, end_datetime):
+    '''(first, last) month when [start, end] covers whole months, None otherwise'''
+    start, end = pd.Timestamp(start_datetime), pd.Timestamp(end_datetime)
+    if start != start.normalize() or not start.is_month_start or not end.is_month_end:
+        return None
+    return start.to_period('M'), end.to_period('M')
+
+
+def query_rollup(rollup, first_month, last_month):
+    return rollup[(rollup['month'] >= first_month) & (rollup['month'] <= last_month)]
@@ -0,0 +1,139 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+
+
+FUZZY_THRESHOLD = 0.4
+FUZZY_MIN_LENGTH = 3
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def normalize_text(text):
+    '''lower case and without accents, so "Café" finds "CAFE"'''
+    text = text.lower()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+@lru_cache(maxsize=65536)
+def tokenize(text):
+    '''the same names repeat a lot between movimientos'''
+    return tuple(_TOKEN.findall(normalize_text(text)))
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def new_index():
+    '''postings: token -> doc ids, grams: trigram -> tokens, docs: doc id -> (texts, normalized text, tokens),
+    positions: doc id -> row position in the last update. sorted_tokens is rebuilt on the first prefix lookup after a change'''
+    return {'postings': {}, 'grams': {}, 'docs': {}, 'positions': {}, 'sorted_tokens': []}
+
+
+def add_document(index, doc_id, texts):
+    if doc_id in index['docs']:
+        remove_document(index, doc_id)
+    tokens = {token for text in texts for token in tokenize(text)}
+    index['docs'][doc_id] = (texts, '\n'.join(normalize_text(text) for text in texts), tokens)
+    for token in tokens:
+        postings = index['postings'].get(token)
+        if postings is None:
+            postings = index['postings'][token] = set()
+            index['sorted_tokens'] = None
+            for gram in trigrams(token):
+                index['grams'].setdefault(gram, set()).add(token)
+        postings.add(doc_id)
+
+
+def remove_document(index, doc_id):
+    for token in index['docs'].pop(doc_id)[2]:
+        postings = index['postings'][token]
+        postings.discard(doc_id)
+        if not postings:
+            del index['postings'][token]
+            index['sorted_tokens'] = None
+            for gram in trigrams(token):
+                index['grams'][gram].discard(token)
+
+
+def update_index(index, doc_ids, *columns):
+    '''doc_ids identify every row across updates (not its position, rows get inserted in the middle),
+    columns are the texts of every row. Only the new rows and the ones whose texts changed are tokenized'''
+    rows = [tuple(text if isinstance(text, str) else '' for text in texts) for texts in zip(*columns)]
+    positions = {doc_id: position for position, doc_id in enumerate(doc_ids)}
+    for doc_id in [doc_id for doc_id in index['docs'] if doc_id not in positions]:
+        remove_document(index, doc_id)
+    for doc_id, texts in zip(doc_ids, rows):
+        doc = index['docs'].get(doc_id)
+        if doc is None or doc[0] != texts:
+            add_document(index, doc_id, texts)
+    index['positions'] = positions
+
+
+def _prefix_tokens(index, term):
+    if index['sorted_tokens'] is None:
+        index['sorted_tokens'] = sorted(index['postings'])
+    tokens = index['sorted_tokens']
+    position = bisect_left(tokens, term)
+    while position < len(tokens) and tokens[position].startswith(term):
+        yield tokens[position]
+        position += 1
+
+
+def _containing_tokens(index, term):
+    '''tokens with term inside, the candidates share every trigram of term'''
+    if len(term) < 3:
+        return [token for token in index['postings'] if term in token]
+    grams = [index['grams'].get(term[i:i + 3], set()) for i in range(len(term) - 2)]
+    return [token for token in set.intersection(*grams) if term in token]
+
+
+def _fuzzy_tokens(index, term):
+    '''tokens whose trigram set is similar enough (jaccard) to the one of term'''
+    term_grams = trigrams(term)
+    shared_counts = Counter(token for gram in term_grams for token in index['grams'].get(gram, ()))
+    for token, shared in shared_counts.items():
+        if shared / (len(term_grams) + len(trigrams(token)) - shared) >= FUZZY_THRESHOLD:
+            yield token
+
+
+def term_tokens(index, term, prefix=True, fuzzy=True):
+    tokens = {term} if term in index['postings'] else set()
+    if prefix:
+        tokens.update(_prefix_tokens(index, term))
+    if fuzzy and len(term) >= FUZZY_MIN_LENGTH:
+        tokens.update(_fuzzy_tokens(index, term))
+    return tokens
+
+
+def _match_terms(index, terms, tokens_for):
+    '''doc ids where every term matches one of the tokens given by tokens_for(index, term)'''
+    result = None
+    for term in terms:
+        docs = set()
+        for token in tokens_for(index, term):
+            docs |= index['postings'][token]
+        result = docs if result is None else result & docs
+        if not result:
+            return set()
+    return result
+
+
+def search(index, query, fuzzy=True):
+    '''Row positions whose text contains query, case and accent insensitive, like str.contains.
+    The tokens of query narrow the candidates and the substring is checked on each of them.
+    With fuzzy, the docs where every term matches a token by prefix or trigram similarity are added'''
+    text = normalize_text(query.strip())
+    terms = tokenize(query)
+    candidates = _match_terms(index, terms, _containing_tokens) if terms else index['docs']
+    result = {doc_id for doc_id in candidates if text in index['docs'][doc_id][1]}
+    if fuzzy and terms:
+        result |= _match_terms(index, terms, term_tokens)
+    return {index['positions'][doc_id] for doc_id in result}
@@ -1,37 +1,79 @@
 import pandas as pd
 import json
-import gspread
-import plotly.express as px
+import os
+import threading
+from plotly.colors import qualitative
 
-from oauth2client.service_account import ServiceAccountCredentials
+from profiling import ENABLED as PROFILING, count_sheets_response
 
 
 SPREADSHEET_NAME = 'finanzas'
 CREDENTIALS_FILE = 'files/client_secret.json'
+APPEND_BATCH_SIZE = 5000
+
+
+_session = {}
+_session_lock = threading.Lock()
 
 
 def get_data_from_spreadsheet():
-    scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
-             "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
-    with open(CREDENTIALS_FILE, 'r') as f:
-        json_credentials = json.load(f)
-    credentials = ServiceAccountCredentials.from_json_keyfile_dict(json_credentials, scope)
-    gclient = gspread.authorize(credentials)
-    return gclient.open(SPREADSHEET_NAME)
-
-
-def spreadsheet_to_pandas(sheet_name):
-    sheet = get_data_from_spreadsheet().worksheet(sheet_name)
-    data = sheet.get_all_values()
+    '''The client is authorized once per process and reused until the credentials file changes.
+    gspread keeps one requests session, so connections are pooled and the token is refreshed when it expires'''
+    # gspread y oauth2client tardan en importarse, se cargan con la primera conexion
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+    credentials_version = os.path.getmtime(CREDENTIALS_FILE)
+    with _session_lock:
+        if _session.get('credentials_version') != credentials_version:
+            scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
+                     "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
+            with open(CREDENTIALS_FILE, 'r') as f:
+                json_credentials = json.load(f)
+            credentials = ServiceAccountCredentials.from_json_keyfile_dict(json_credentials, scope)
+            gclient = gspread.authorize(credentials)
+            if PROFILING:
+                gclient.http_client.session.hooks['response'].append(count_sheets_response)
+            _session.clear()
+            _session.update(credentials_version=credentials_version, spreadsheet=gclient.open(SPREADSHEET_NAME), worksheets={})
+        return _session['spreadsheet']
+
+
+def get_worksheet(sheet_name):
+    spreadsheet = get_data_from_spreadsheet()
+    worksheets = _session['worksheets']
+    if sheet_name not in worksheets:
+        worksheets[sheet_name] = spreadsheet.worksheet(sheet_name)
+    return worksheets[sheet_name]
+
+
+def forget_worksheets():
+    _session.get('worksheets', {}).clear()
+
+
+def values_to_pandas(data):
     headers = data.pop(0)
-    df = pd.DataFrame(data, columns=headers).replace('', None)
-    return df
+    return pd.DataFrame(data, columns=headers).replace('', None)
+
+
+def spreadsheets_to_pandas(sheet_names):
+    '''Reads several sheets in a single values_batchGet request'''
+    from gspread.utils import absolute_range_name, fill_gaps
+    ranges = [absolute_range_name(sheet_name) for sheet_name in sheet_names]
+    response = get_data_from_spreadsheet().values_batch_get(ranges)
+    return {sheet_name: values_to_pandas(fill_gaps(value_range.get('values', [[]])))
+            for sheet_name, value_range in zip(sheet_names, response['valueRanges'])}
+
+
+def to_sheet_values(dataframe):
+    dataframe = dataframe.astype(object).map(lambda x: x.strftime('%Y-%m-%d') if isinstance(x, pd.Timestamp) else x)
+    return dataframe.replace([pd.NA, pd.NaT, float('inf'), float('-inf'), pd.NaT, pd.NA, float('nan')], None)
 
 
 def save_dataframe_to_spreadsheet(sheet_name, dataframe):
+    from gspread.exceptions import WorksheetNotFound
     sheet = get_data_from_spreadsheet()
-    dataframe = dataframe.map(lambda x: x.strftime('%Y-%m-%d') if isinstance(x, pd.Timestamp) else x)
-    dataframe = dataframe.replace([pd.NA, pd.NaT, float('inf'), float('-inf'), pd.NaT, pd.NA, float('nan')], None)
+    dataframe = to_sheet_values(dataframe)
+    forget_worksheets()
 
     try:
         worksheet = sheet.worksheet(sheet_name)
@@ -40,7 +82,7 @@ def save_dataframe_to_spreadsheet(sheet_name, dataframe):
             sheet.del_worksheet(sheet.worksheet(renamed_sheet_name))
         sheet.duplicate_sheet(worksheet.id, new_sheet_name=renamed_sheet_name)
         sheet.del_worksheet(worksheet)
-    except gspread.exceptions.WorksheetNotFound:
+    except WorksheetNotFound:
         pass
 
     try:
@@ -55,16 +97,110 @@ def save_dataframe_to_spreadsheet(sheet_name, dataframe):
         raise e
 
 
+def _same_cell(stored, value):
+    if value is None or value == '':
+        return stored in ('', None)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return float(stored) == float(value)
+        except (TypeError, ValueError):
+            return False
+    return str(stored) == str(value)
+
+
+def _row_ranges(row_numbers):
+    '''groups sorted row numbers into (first, last) runs of consecutive rows'''
+    ranges = []
+    for row_number in row_numbers:
+        if ranges and ranges[-1][1] == row_number - 1:
+            ranges[-1][1] = row_number
+        else:
+            ranges.append([row_number, row_number])
+    return ranges
+
+
+def read_stored_rows(worksheet, columns, key, stored_copy=None):
+    '''The sheet as a list of rows, like get_all_values.
+    With stored_copy (a frame with what the sheet holds) only the header and the key column are downloaded:
+    the key column gives the row of every key and the copy its content'''
+    from gspread.utils import ValueRenderOption, rowcol_to_a1
+    if stored_copy is None or key not in columns or key not in stored_copy.columns:
+        return worksheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+    key_letter = rowcol_to_a1(1, columns.index(key) + 1)[:-1]
+    header, key_cells = worksheet.batch_get(['1:1', f"{key_letter}2:{key_letter}"],
+                                            value_render_option=ValueRenderOption.unformatted)
+    if not header or header[0] != columns:
+        return header[:1]
+    stored_keys = [str(cell[0]) if cell else '' for cell in key_cells]
+    copy = to_sheet_values(stored_copy.reindex(columns=columns))
+    copy_rows = dict(zip(copy[key].astype(str), copy.values.tolist()))
+    if len(copy_rows) != len(copy) or len(stored_keys) != len(copy_rows) or set(stored_keys) != copy_rows.keys():
+        # la copia no coincide con la hoja: se lee entera
+        return worksheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+    return [header[0]] + [copy_rows[row_key] for row_key in stored_keys]
+
+
+def sync_dataframe_to_spreadsheet(sheet_name, dataframe, key='id', stored_copy=None):
+    '''Sends only the rows whose key was added, changed or removed.
+    stored_copy is the local copy of the sheet's current version, when given the sheet is not downloaded (see read_stored_rows).
+    Falls back to save_dataframe_to_spreadsheet when the stored layout can't be diffed'''
+    from gspread.exceptions import WorksheetNotFound
+    from gspread.utils import InsertDataOption, ValueInputOption, rowcol_to_a1
+    sheet = get_data_from_spreadsheet()
+    dataframe = to_sheet_values(dataframe)
+    columns = dataframe.columns.tolist()
+    try:
+        worksheet = get_worksheet(sheet_name)
+        stored = read_stored_rows(worksheet, columns, key, stored_copy)
+    except WorksheetNotFound:
+        stored = []
+
+    new_keys = dataframe[key].astype(str) if key in columns else None
+    if not stored or stored[0] != columns or new_keys is None or new_keys.duplicated().any():
+        save_dataframe_to_spreadsheet(sheet_name, dataframe)
+        return {'mode': 'full', 'appended': len(dataframe), 'updated': 0, 'deleted': 0}
+
+    key_col = columns.index(key)
+    stored_rows = {str(row[key_col]): (row_number, row) for row_number, row in enumerate(stored[1:], start=2)}
+    if len(stored_rows) != len(stored) - 1:
+        save_dataframe_to_spreadsheet(sheet_name, dataframe)
+        return {'mode': 'full', 'appended': len(dataframe), 'updated': 0, 'deleted': 0}
+
+    to_append, to_update = [], []
+    for row_key, values in zip(new_keys, dataframe.values.tolist()):
+        if row_key not in stored_rows:
+            to_append.append(values)
+            continue
+        row_number, stored_values = stored_rows[row_key]
+        if not all(_same_cell(s, v) for s, v in zip(stored_values, values)):
+            to_update.append({'range': f"A{row_number}:{rowcol_to_a1(row_number, len(columns))}", 'values': [values]})
+    kept_keys = set(new_keys)
+    to_delete = sorted(row_number for row_key, (row_number, _) in stored_rows.items() if row_key not in kept_keys)
+
+    if to_update:
+        worksheet.batch_update(to_update, value_input_option=ValueInputOption.raw)
+    if to_delete:
+        # de abajo hacia arriba para que los indices no se corran
+        requests = [{'deleteDimension': {'range': {'sheetId': worksheet.id, 'dimension': 'ROWS',
+                                                   'startIndex': first - 1, 'endIndex': last}}}
+                    for first, last in reversed(_row_ranges(to_delete))]
+        sheet.batch_update({'requests': requests})
+    for i in range(0, len(to_append), APPEND_BATCH_SIZE):
+        worksheet.append_rows(to_append[i:i + APPEND_BATCH_SIZE], value_input_option=ValueInputOption.raw,
+                              insert_data_option=InsertDataOption.insert_rows, table_range='A1')
+
+    return {'mode': 'diff', 'appended': len(to_append), 'updated': len(to_update), 'deleted': len(to_delete)}
+
+
 def generate_distinct_colors(n=15):
-    colors = px.colors.qualitative.Plotly
+    colors = qualitative.Plotly
     if n <= len(colors):
         return colors[:n]
     else:
         return colors * (n // len(colors)) + colors[:n % len(colors)]
 
 
-def get_data(sheet_name):
-    df = spreadsheet_to_pandas(sheet_name=sheet_name)
+def to_names_map(df):
     if df.empty:
         return {}
     data_map = df.set_index('tag_name')['keywords'].apply(lambda x: x.split(',')).to_dict()
@@ -75,11 +211,3 @@ def get_tags_colors_map(tags_names_map):
     tags_colors_map = {tag: color for tag, color in zip(tags_names_map.keys(), generate_distinct_colors(len(tags_names_map)))}
     tags_colors_map["otros"] = "gray"  # por que si
     return tags_colors_map
-
-
-def get_tags_names_map():
-    return get_data('tags')
-
-
-def get_alias_names_map():
-    return get_data('alias')
\ No newline at end of file
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+from spreadsheets import to_sheet_values
+
+
+DB_NAME = "movimientos.db"
+INDEXED_COLUMNS = ['id', 'date']
+
+
+@contextmanager
+def connect():
+    conn = sqlite3.connect(DB_NAME, timeout=30, isolation_level=None)
+    try:
+        # WAL: las lecturas de otras sesiones no se bloquean mientras se escribe
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def read_tables(table_names):
+    '''Same shape as the sheets: one frame per table, read from a single snapshot. Missing tables are empty'''
+    with connect() as conn:
+        conn.execute('BEGIN')
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        frames = {name: pd.read_sql_query(f'SELECT * FROM "{name}" ORDER BY rowid', conn) if name in existing else pd.DataFrame()
+                  for name in table_names}
+        conn.execute('COMMIT')
+    return frames
+
+
+def _column_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    # fechas como texto 'YYYY-MM-DD', igual que en las sheets
+    return 'TEXT'
+
+
+def _table_layout(conn, table_name):
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+
+
+def _has_key_index(conn, table_name, key):
+    return any(row[1] == f"{table_name}_{key}" and row[2] for row in conn.execute(f'PRAGMA index_list("{table_name}")'))
+
+
+def _columns(names):
+    return ', '.join(f'"{name}"' for name in names)
+
+
+def _rewrite_table(conn, table_name, layout, rows, unique_key=None):
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    definitions = ', '.join(f'"{col}" {col_type}' for col, col_type in layout)
+    conn.execute(f'CREATE TABLE "{table_name}" ({definitions})')
+    conn.executemany(f'INSERT INTO "{table_name}" VALUES ({", ".join("?" * len(layout))})', rows)
+    names = [col for col, _ in layout]
+    for col in dict.fromkeys(INDEXED_COLUMNS + ([unique_key] if unique_key else [])):
+        if col in names:
+            unique = 'UNIQUE ' if col == unique_key else ''
+            conn.execute(f'CREATE {unique}INDEX "{table_name}_{col}" ON "{table_name}" ("{col}")')
+
+
+def write_table(table_name, df, key='id'):
+    '''Makes df the content of the table in one transaction, values stored as in the sheets.
+    Like the row level sync of the sheets, only the rows whose key was added, changed or removed are written.
+    The table is rebuilt when its columns changed or the keys are not unique'''
+    values = to_sheet_values(df)
+    layout = [(col, _column_type(dtype)) for col, dtype in df.dtypes.items()]
+    names = [col for col, _ in layout]
+    rows = list(values.itertuples(index=False, name=None))
+    unique_keys = key in names and not values[key].duplicated().any()
+    with connect() as conn, transaction(conn):
+        if not unique_keys or _table_layout(conn, table_name) != layout or not _has_key_index(conn, table_name, key):
+            _rewrite_table(conn, table_name, layout, rows, key if unique_keys else None)
+            return {'mode': 'full', 'inserted': len(rows), 'updated': 0, 'deleted': 0}
+
+        key_col = names.index(key)
+        stored = {row[key_col]: row for row in conn.execute(f'SELECT {_columns(names)} FROM "{table_name}"')}
+        to_insert, to_update = [], []
+        for row in rows:
+            stored_row = stored.pop(row[key_col], None)
+            if stored_row is None:
+                to_insert.append(row)
+            elif stored_row != row:
+                to_update.append(row[:key_col] + row[key_col + 1:] + (row[key_col],))
+        # lo que queda en stored ya no esta en df
+        assignments = ', '.join(f'"{col}" = ?' for col in names if col != key)
+        conn.executemany(f'DELETE FROM "{table_name}" WHERE "{key}" = ?', [(row_key,) for row_key in stored])
+        conn.executemany(f'UPDATE "{table_name}" SET {assignments} WHERE "{key}" = ?', to_update)
+        conn.executemany(f'INSERT INTO "{table_name}" VALUES ({", ".join("?" * len(names))})', to_insert)
+    return {'mode': 'diff', 'inserted': len(to_insert), 'updated': len(to_update), 'deleted': len(stored)}
+
+
+def delete_rows(table_name, ids, key='id'):
+    with connect() as conn, transaction(conn):
+        conn.executemany(f'DELETE FROM "{table_name}" WHERE "{key}" = ?', [(str(row_id),) for row_id in ids])
+
+
+def replace_database(db_bytes):
+    '''An uploaded .db replaces the local one, the WAL files of the old one would corrupt it'''
+    tmp_path = f"{DB_NAME}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(db_bytes)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(DB_NAME + suffix):
+            os.remove(DB_NAME + suffix)
+    os.replace(tmp_path, DB_NAME)
@@ -0,0 +1,117 @@
+import os
+import threading
+
+import sqlite_store
+from local_cache import read_cached_sheet, read_sheets, synced_copy, write_cached_sheet
+from spreadsheets import CREDENTIALS_FILE, get_data_from_spreadsheet, sync_dataframe_to_spreadsheet
+
+
+# 'sheets' (Google Sheets, default) o 'sqlite' (movimientos.db, funciona offline)
+STORAGE = os.environ.get('PFINANCE_STORAGE', 'sheets')
+# con sqlite, cada escritura se copia a Sheets en segundo plano si hay credenciales
+SHEETS_MIRROR = os.environ.get('PFINANCE_SHEETS_MIRROR', '1') == '1'
+
+# synced: {tabla: (modifiedTime de la hoja, lo ultimo que se le mando)}, para diferenciar sin bajarla
+_mirror = {'pending': {}, 'errors': {}, 'synced': {}, 'thread': None}
+_mirror_lock = threading.Lock()
+
+
+def use_sqlite():
+    return STORAGE == 'sqlite'
+
+
+def is_configured():
+    '''sqlite works without the Google credentials'''
+    return use_sqlite() or os.path.exists(CREDENTIALS_FILE)
+
+
+def read_tables(table_names, parsers=None, cached=(), force=False):
+    '''{name: frame} for every table, parsed. cached and force only apply to the sheets backend'''
+    if not use_sqlite():
+        return read_sheets(table_names, parsers=parsers, cached=cached, force=force)
+    parsers = parsers or {}
+    frames = sqlite_store.read_tables(table_names)
+    return {name: parsers[name](df) if parsers.get(name) else df for name, df in frames.items()}
+
+
+def read_table(table_name, parse=None, force=False):
+    if not use_sqlite():
+        return read_cached_sheet(table_name, parse=parse, force=force)
+    return read_tables([table_name], parsers={table_name: parse})[table_name]
+
+
+def save_table(table_name, df, key='id'):
+    '''Row level sync by key. sqlite: one transaction, then mirrored to Sheets'''
+    if not use_sqlite():
+        return sync_dataframe_to_spreadsheet(table_name, df, key, stored_copy=synced_copy(table_name))
+    result = sqlite_store.write_table(table_name, df, key)
+    mirror_table(table_name, df, key)
+    return result
+
+
+def remove_rows(table_name, ids, remaining, key='id'):
+    '''remaining is the table without the ids, it is what Sheets gets synced to'''
+    if not use_sqlite():
+        return sync_dataframe_to_spreadsheet(table_name, remaining, key, stored_copy=synced_copy(table_name))
+    sqlite_store.delete_rows(table_name, ids, key)
+    mirror_table(table_name, remaining, key)
+
+
+def write_local_cache(table_name, df):
+    '''with sqlite the database already is the local copy'''
+    if not use_sqlite():
+        write_cached_sheet(table_name, df)
+
+
+def mirror_table(table_name, df, key='id'):
+    '''Queues the table for the background sync to Sheets, only its last version is sent'''
+    if not (SHEETS_MIRROR and os.path.exists(CREDENTIALS_FILE)):
+        return
+    with _mirror_lock:
+        _mirror['pending'][table_name] = (df, key)
+        if _mirror['thread'] is None:
+            _mirror['thread'] = threading.Thread(target=_mirror_worker, daemon=True)
+            _mirror['thread'].start()
+
+
+def _mirror_worker():
+    while True:
+        with _mirror_lock:
+            if not _mirror['pending']:
+                _mirror['thread'] = None
+                return
+            table_name, (df, key) = _mirror['pending'].popitem()
+        try:
+            sync_dataframe_to_spreadsheet(table_name, df, key, stored_copy=_mirrored_copy(table_name))
+            synced, error = (get_data_from_spreadsheet().get_lastUpdateTime(), df), None
+        except Exception as e:
+            # sin conexion: queda el error, la proxima escritura vuelve a sincronizar la tabla entera
+            synced, error = None, str(e)
+        with _mirror_lock:
+            if error is None:
+                _mirror['synced'][table_name] = synced
+                _mirror['errors'].pop(table_name, None)
+            else:
+                _mirror['synced'].pop(table_name, None)
+                _mirror['errors'][table_name] = error
+
+
+def _mirrored_copy(table_name):
+    '''what the mirror last sent, while nobody else changed the spreadsheet since'''
+    with _mirror_lock:
+        synced = _mirror['synced'].get(table_name)
+    if synced is None or synced[0] != get_data_from_spreadsheet().get_lastUpdateTime():
+        return None
+    return synced[1]
+
+
+def mirror_status():
+    with _mirror_lock:
+        return list(_mirror['pending']), dict(_mirror['errors'])
+
+
+def wait_for_mirror(timeout=None):
+    '''the mirror thread is a daemon, a script has to wait for it before exiting'''
+    thread = _mirror['thread']
+    if thread is not None:
+        thread.join(timeout)